@@ -1,4 +1,5 @@
 import enum
+import functools
 import hashlib
 
 
@@ -7,35 +8,70 @@ FAMILY_VERSION = '0.1'
 NAMESPACE = hashlib.sha512(FAMILY_NAME.encode('utf-8')).hexdigest()[:6]
 USER_PREFIX = '00'
 RECORD_PREFIX = '01'
+RECORD_STATUS_PREFIX = '02'
+RECORD_LOCATIONS_PREFIX = '03'
+ADDRESS_CACHE_SIZE = 2 ** 16
 
 
 @enum.unique
 class AddressSpace(enum.IntEnum):
     USER = 0
     RECORD = 1
+    RECORD_STATUS = 2
+    RECORD_LOCATIONS = 3
 
     OTHER_FAMILY = 100
 
 
+ADDRESS_TYPES = {
+    NAMESPACE + USER_PREFIX: AddressSpace.USER,
+    NAMESPACE + RECORD_PREFIX: AddressSpace.RECORD,
+    NAMESPACE + RECORD_STATUS_PREFIX: AddressSpace.RECORD_STATUS,
+    NAMESPACE + RECORD_LOCATIONS_PREFIX: AddressSpace.RECORD_LOCATIONS
+}
+ADDRESS_TYPE_PREFIX_LENGTH = len(NAMESPACE) + len(USER_PREFIX)
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
 def get_user_address(public_key):
     return NAMESPACE + USER_PREFIX + hashlib.sha512(
         public_key.encode('utf-8')).hexdigest()[:62]
 
 
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
 def get_record_address(record_id):
     return NAMESPACE + RECORD_PREFIX + hashlib.sha512(
         record_id.encode('utf-8')).hexdigest()[:62]
 
 
-def get_address_type(address):
-    if address[:len(NAMESPACE)] != NAMESPACE:
-        return AddressSpace.OTHER_FAMILY
+def get_record_status_address(record_id):
+    return NAMESPACE + RECORD_STATUS_PREFIX + \
+        get_record_address(record_id)[len(NAMESPACE + RECORD_PREFIX):]
+
+
+def get_record_locations_address(record_id):
+    return NAMESPACE + RECORD_LOCATIONS_PREFIX + \
+        get_record_address(record_id)[len(NAMESPACE + RECORD_PREFIX):]
 
-    infix = address[6:8]
 
-    if infix == '00':
-        return AddressSpace.USER
-    if infix == '01':
-        return AddressSpace.RECORD
+def get_record_addresses(record_ids):
+    """Returns the addresses of several records, in the order given"""
+    return [get_record_address(record_id) for record_id in record_ids]
 
-    return AddressSpace.OTHER_FAMILY
+
+def get_address_cache_info():
+    """Returns the hit/miss statistics of the user and record address
+    caches, keyed by AddressSpace
+    """
+    return {
+        AddressSpace.USER: get_user_address.cache_info(),
+        AddressSpace.RECORD: get_record_address.cache_info()
+    }
+
+
+def get_address_type(address):
+    """Classifies an address with a single lookup of its namespace and
+    type infix in ADDRESS_TYPES
+    """
+    return ADDRESS_TYPES.get(
+        address[:ADDRESS_TYPE_PREFIX_LENGTH], AddressSpace.OTHER_FAMILY)
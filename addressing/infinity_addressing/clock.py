@@ -0,0 +1,8 @@
+import time
+
+
+def get_time():
+    """Returns the current time as a Unix UTC timestamp in whole seconds,
+    the resolution of InfinityPayload.timestamp
+    """
+    return round(time.time())
@@ -0,0 +1,18 @@
+"""Layouts of the data stored at an infinity state address.
+
+CONTAINER is the original layout: a UserContainer or RecordContainer whose
+entries are scanned for the wanted key. SINGLE_ENTRY stores exactly one User
+or Record prefixed by SINGLE_ENTRY_MARKER. The marker is the tag of protobuf
+field number 0, which is never valid, so it cannot start a serialized
+container and both layouts can be read from the same address.
+"""
+
+CONTAINER = 'container'
+SINGLE_ENTRY = 'single'
+STATE_LAYOUTS = (CONTAINER, SINGLE_ENTRY)
+
+SINGLE_ENTRY_MARKER = b'\x01'
+
+
+def is_single_entry(data):
+    return data[:1] == SINGLE_ENTRY_MARKER
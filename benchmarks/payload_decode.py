@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Compares the per-transaction cost of decoding an InfinityPayload and
+reading its data the way the handler does, between the table-resolved
+InfinityPayload and the previous HasField/action comparison chain.
+
+    python3 benchmarks/payload_decode.py --accesses 12
+"""
+import argparse
+import timeit
+
+import stub_validator
+from infinity_protobuf import payload_pb2
+from infinity_tp.payload import InfinityPayload
+
+
+class ChainedInfinityPayload(object):
+    """InfinityPayload as it was before DATA_FIELDS, walking one HasField
+    and action comparison per action on every data access
+    """
+    def __init__(self, payload):
+        self._transaction = payload_pb2.InfinityPayload()
+        self._transaction.ParseFromString(payload)
+
+    @property
+    def action(self):
+        return self._transaction.action
+
+    @property
+    def data(self):
+        for action, field in (
+                (payload_pb2.InfinityPayload.CREATE_USER, 'create_user'),
+                (payload_pb2.InfinityPayload.CREATE_RECORD, 'create_record'),
+                (payload_pb2.InfinityPayload.TRANSFER_RECORD,
+                 'transfer_record'),
+                (payload_pb2.InfinityPayload.UPDATE_RECORD_LOCATION,
+                 'update_record_location'),
+                (payload_pb2.InfinityPayload.UPDATE_RECORD_FOR_SALE,
+                 'update_record_for_sale'),
+                (payload_pb2.InfinityPayload.UPDATE_RECORD_STOLEN,
+                 'update_record_stolen')):
+            if self._transaction.HasField(field) and \
+                    self._transaction.action == action:
+                return getattr(self._transaction, field)
+        raise ValueError('Action does not match payload data')
+
+    @property
+    def timestamp(self):
+        return self._transaction.timestamp
+
+
+def decode(payload_class, payload_bytes, accesses):
+    payload = payload_class(payload_bytes)
+    for _ in range(accesses):
+        _ = payload.action
+        _ = payload.data
+    return payload.timestamp
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--accesses', type=int, default=12,
+        help='Reads of payload.action and payload.data per transaction')
+    parser.add_argument(
+        '--number', type=int, default=100000,
+        help='Transactions decoded per measurement')
+    opts = parser.parse_args()
+
+    payloads = {
+        'CREATE_USER': stub_validator.make_create_user('key').payload,
+        'CREATE_RECORD':
+            stub_validator.make_create_record('key', 'record').payload,
+        'UPDATE_RECORD_LOCATION':
+            stub_validator.make_update_record_location(
+                'key', 'record', 1, 1).payload,
+    }
+
+    print('{:<24} {:>12} {:>12} {:>8}'.format(
+        'action', 'chained us', 'table us', 'saving'))
+    for name, payload_bytes in payloads.items():
+        chained, table = (
+            min(timeit.repeat(
+                lambda cls=payload_class: decode(
+                    cls, payload_bytes, opts.accesses),
+                number=opts.number,
+                repeat=3)) / opts.number * 1e6
+            for payload_class in (ChainedInfinityPayload, InfinityPayload))
+        print('{:<24} {:>12.2f} {:>12.2f} {:>7.0%}'.format(
+            name, chained, table, 1 - table / chained))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""Benchmarks InfinityHandler.apply for every InfinityPayload action
+against an in-memory StubContext, over records whose location and owner
+histories range from 1 to 100k entries. Reports ops/sec, p50/p99
+latency and the address cache hit rate per action and history size.
+
+    python3 benchmarks/processor_apply.py --histories 1 1000 100000
+"""
+import argparse
+import time
+
+import stub_validator
+from infinity_addressing import addresser
+from infinity_protobuf import payload_pb2
+from infinity_protobuf import record_pb2
+from infinity_protobuf import user_pb2
+from infinity_tp.handler import InfinityHandler
+
+
+OWNER = 'owner'
+OTHER = 'other'
+RECORD_ID = 'benchmark-record'
+BATCH_SIZE = 10
+ACTION = payload_pb2.InfinityPayload
+
+
+def seed_state(history):
+    """Returns state holding two users and one record owned by OWNER
+    with history locations and history owners
+    """
+    state = {}
+    for public_key in (OWNER, OTHER):
+        state[addresser.get_user_address(public_key)] = user_pb2.UserContainer(
+            entries=[user_pb2.User(public_key=public_key, name=public_key)]
+        ).SerializeToString()
+
+    owners = [
+        record_pb2.Record.Owner(
+            user_id=OWNER if (history - index) % 2 else OTHER,
+            timestamp=index)
+        for index in range(history)
+    ]
+    locations = [
+        record_pb2.Record.Location(latitude=index, longitude=index,
+                                   timestamp=index)
+        for index in range(history)
+    ]
+    record = record_pb2.Record(
+        record_id=RECORD_ID,
+        owners=owners,
+        current_owner=OWNER,
+        locations=locations)
+    state[addresser.get_record_address(RECORD_ID)] = \
+        record_pb2.RecordContainer(entries=[record]).SerializeToString()
+    return state
+
+
+def make_transactions(action, count):
+    """Returns count valid transactions of the given action, to be applied
+    in order to the state built by seed_state
+    """
+    make = stub_validator.make_transaction
+    if action == ACTION.CREATE_USER:
+        return [make('user-{}'.format(index), action, 'create_user',
+                     payload_pb2.CreateUserAction(name='user', role='User'))
+                for index in range(count)]
+    if action == ACTION.CREATE_RECORD:
+        return [make(OWNER, action, 'create_record',
+                     payload_pb2.CreateRecordAction(
+                         record_id='record-{}'.format(index), name='record'))
+                for index in range(count)]
+    if action == ACTION.TRANSFER_RECORD:
+        return [make(OWNER if index % 2 == 0 else OTHER,
+                     action, 'transfer_record',
+                     payload_pb2.TransferRecordAction(
+                         record_id=RECORD_ID,
+                         receiving_user=OTHER if index % 2 == 0 else OWNER))
+                for index in range(count)]
+    if action == ACTION.UPDATE_RECORD_LOCATION:
+        return [make(OWNER, action, 'update_record_location',
+                     payload_pb2.UpdateRecordLocationAction(
+                         record_id=RECORD_ID, latitude=index,
+                         longitude=index))
+                for index in range(count)]
+    if action == ACTION.UPDATE_RECORD_FOR_SALE:
+        return [make(OWNER, action, 'update_record_for_sale',
+                     payload_pb2.UpdateRecordForSaleAction(
+                         record_id=RECORD_ID, isForSale=index % 2 == 0))
+                for index in range(count)]
+    if action == ACTION.UPDATE_RECORD_STOLEN:
+        return [make(OWNER, action, 'update_record_stolen',
+                     payload_pb2.UpdateRecordStolenAction(
+                         record_id=RECORD_ID, is_stolen=index % 2 == 0))
+                for index in range(count)]
+    if action == ACTION.BATCH_UPDATE_RECORD_LOCATIONS:
+        return [make(OWNER, action, 'batch_update_record_locations',
+                     payload_pb2.BatchUpdateRecordLocationsAction(updates=[
+                         payload_pb2.UpdateRecordLocationAction(
+                             record_id=RECORD_ID, latitude=index,
+                             longitude=offset)
+                         for offset in range(BATCH_SIZE)]))
+                for index in range(count)]
+    if action == ACTION.BATCH_CREATE_RECORDS:
+        return [make(OWNER, action, 'batch_create_records',
+                     payload_pb2.BatchCreateRecordsAction(records=[
+                         payload_pb2.CreateRecordAction(
+                             record_id='record-{}-{}'.format(index, offset),
+                             name='record')
+                         for offset in range(BATCH_SIZE)]))
+                for index in range(count)]
+    raise ValueError('Unknown action: {}'.format(action))
+
+
+def percentile(sorted_samples, fraction):
+    index = min(len(sorted_samples) - 1, int(len(sorted_samples) * fraction))
+    return sorted_samples[index]
+
+
+def cache_lookups():
+    """Returns the summed hits and misses of the address caches"""
+    infos = addresser.get_address_cache_info().values()
+    return (sum(info.hits for info in infos),
+            sum(info.misses for info in infos))
+
+
+def measure(action, history, count, latency, max_locations):
+    handler = InfinityHandler(max_locations=max_locations)
+    context = stub_validator.StubContext(
+        latency=latency, state=seed_state(history))
+    transactions = make_transactions(action, count)
+
+    hits_before, misses_before = cache_lookups()
+    samples = []
+    for transaction in transactions:
+        start = time.perf_counter()
+        handler.apply(transaction, context)
+        samples.append(time.perf_counter() - start)
+    hits, misses = cache_lookups()
+    hits -= hits_before
+    misses -= misses_before
+
+    samples.sort()
+    return (len(samples) / sum(samples),
+            percentile(samples, 0.50),
+            percentile(samples, 0.99),
+            hits / (hits + misses) if hits + misses else 0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--actions', nargs='+', choices=ACTION.Action.keys(),
+        default=ACTION.Action.keys(),
+        help='Actions to benchmark')
+    parser.add_argument(
+        '--histories', type=int, nargs='+', default=[1, 100, 10000, 100000],
+        help='Location and owner history sizes of the benchmarked record')
+    parser.add_argument(
+        '--count', type=int, default=200,
+        help='Transactions applied per action and history size')
+    parser.add_argument(
+        '--latency', type=float, default=0.0,
+        help='Seconds injected into every get_state/set_state call')
+    parser.add_argument(
+        '--max-locations', type=int, default=0,
+        help='Location retention passed to InfinityHandler')
+    opts = parser.parse_args()
+
+    print('{:<30} {:>8} {:>12} {:>10} {:>10} {:>10}'.format(
+        'action', 'history', 'ops/sec', 'p50 ms', 'p99 ms', 'addr hit'))
+    for action_name in opts.actions:
+        for history in opts.histories:
+            rate, p50, p99, hit_rate = measure(
+                ACTION.Action.Value(action_name),
+                history,
+                opts.count,
+                opts.latency,
+                opts.max_locations)
+            print('{:<30} {:>8} {:>12.1f} {:>10.3f} {:>10.3f} {:>10.1%}'
+                  .format(action_name, history, rate, p50 * 1000,
+                          p99 * 1000, hit_rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Measures how UPDATE_RECORD_LOCATION throughput scales with the number
+of processor workers. Each measurement starts tp-infinity --workers N
+through infinity_tp.main, connected to a StubValidator that serves state
+from memory, and times the transactions it hands out until every one has
+been answered.
+
+    python3 benchmarks/processor_workers.py --workers 1 2 4
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import time
+
+import stub_validator
+from infinity_tp import main as processor_main
+
+
+PUBLIC_KEY = 'benchmark'
+
+
+def start_processor(url, workers):
+    """Runs tp-infinity in a child process, as if started from the
+    command line
+    """
+    process = multiprocessing.Process(
+        target=processor_main.main,
+        args=(['--connect', url, '--workers', str(workers)],))
+    process.start()
+    return process
+
+
+def stop_processor(process):
+    """Interrupts tp-infinity like Ctrl-C would, which also stops its
+    workers
+    """
+    os.kill(process.pid, signal.SIGINT)
+    process.join()
+
+
+def measure(workers, transaction_count, record_count):
+    validator = stub_validator.StubValidator()
+    process = start_processor(validator.url, workers)
+    try:
+        validator.wait_for_workers(workers)
+        validator.run([
+            (PUBLIC_KEY, stub_validator.make_create_user(PUBLIC_KEY))])
+        validator.run([
+            (str(index),
+             stub_validator.make_create_record(PUBLIC_KEY, str(index)))
+            for index in range(record_count)
+        ])
+
+        transactions = [
+            (str(index % record_count),
+             stub_validator.make_update_record_location(
+                 PUBLIC_KEY, str(index % record_count), index, index))
+            for index in range(transaction_count)
+        ]
+        start = time.perf_counter()
+        rejected = validator.run(transactions)
+        elapsed = time.perf_counter() - start
+    finally:
+        stop_processor(process)
+        validator.close()
+
+    if rejected:
+        raise RuntimeError(
+            '{} of {} transactions were rejected'.format(
+                rejected, transaction_count))
+    return transaction_count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--workers', type=int, nargs='+', default=[1, 2, 4, 8],
+        help='Worker counts to measure')
+    parser.add_argument(
+        '--transactions', type=int, default=4000,
+        help='Transactions applied per measurement')
+    parser.add_argument(
+        '--records', type=int, default=100,
+        help='Records the location updates are spread over; updates of '
+             'the same record are never applied concurrently')
+    opts = parser.parse_args()
+
+    baseline = None
+    print('{:>8} {:>12} {:>8}'.format('workers', 'txn/sec', 'speedup'))
+    for workers in opts.workers:
+        rate = measure(workers, opts.transactions, opts.records)
+        baseline = baseline or rate
+        print('{:>8} {:>12.1f} {:>7.2f}x'.format(
+            workers, rate, rate / baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""Checks with EXPLAIN that the hot queries of the REST API and the
+subscriber are planned on the indexes created by `infinity-subscriber
+init`. Seeds a scratch postgres database, whose subscriber tables are
+dropped and recreated, with versioned users and records first, and exits
+non-zero if a query is planned without its expected index.
+
+    python3 benchmarks/query_plans.py --records 5000 --blocks 10
+"""
+import argparse
+import json
+import sys
+
+import psycopg2
+
+import stub_validator  # noqa: F401 pylint: disable=unused-import
+from infinity_rest_api import database as rest_database
+from infinity_subscriber.database import Database
+from infinity_subscriber.database import MAX_BLOCK_NUMBER
+
+
+TABLES = ('blocks', 'auth', 'records', 'record_locations', 'record_owners',
+          'users')
+# (description, query, indexes any of which the plan must use)
+SUBSCRIBER_QUERIES = [
+    ('subscriber close out users',
+     """
+     UPDATE users SET end_block_num = 1
+     WHERE end_block_num = {} AND public_key = ANY(ARRAY['user-7'])
+     """.format(MAX_BLOCK_NUMBER),
+     ('users_current_idx', 'users_public_key_idx')),
+    ('subscriber close out records',
+     """
+     UPDATE records SET end_block_num = 1
+     WHERE end_block_num = {} AND record_id = ANY(ARRAY['record-7'])
+     """.format(MAX_BLOCK_NUMBER),
+     ('records_current_idx', 'records_record_id_idx')),
+    ('subscriber indexed locations',
+     """
+     SELECT record_id, count(*), count(location_index),
+     min(location_index), max(location_index)
+     FROM record_locations
+     WHERE end_block_num = {} AND record_id = ANY(ARRAY['record-7'])
+     GROUP BY record_id
+     """.format(MAX_BLOCK_NUMBER),
+     ('record_locations_current_idx', 'record_locations_record_id_idx')),
+    ('subscriber indexed owners',
+     """
+     SELECT record_id, count(*) FROM record_owners
+     WHERE end_block_num = {} AND record_id = ANY(ARRAY['record-7'])
+     GROUP BY record_id
+     """.format(MAX_BLOCK_NUMBER),
+     ('record_owners_current_idx', 'record_owners_record_id_idx')),
+]
+
+
+def get_rest_queries(block_num):
+    """Returns the queries the REST API runs, built by its own database
+    module, as (description, query, params, indexes) at block_num
+    """
+    # pylint: disable=protected-access
+    build_list_query = rest_database._build_list_query
+
+    def list_query(table, key, columns, fields, limit=None, after=None,
+                   filters=None):
+        return build_list_query(
+            table, key, columns, fields, block_num, limit, after,
+            rest_database.RECORD_FILTERS, filters)
+
+    history_params = {'record_ids': ['record-7', 'record-8'],
+                      'block_num': block_num}
+    return [
+        ('REST fetch user',
+         rest_database.FETCH_USER_QUERY,
+         {'public_key': 'user-7', 'block_num': block_num},
+         ('users_public_key_idx',)),
+        ('REST list users',
+         *list_query('users', 'public_key', rest_database.USER_FIELDS,
+                     rest_database.DEFAULT_USER_FIELDS),
+         ('users_block_range_idx', 'users_public_key_idx')),
+        ('REST list users page',
+         *list_query('users', 'public_key', rest_database.USER_FIELDS,
+                     rest_database.DEFAULT_USER_FIELDS,
+                     limit=100, after='user-7'),
+         ('users_public_key_idx',)),
+        ('REST fetch record',
+         rest_database.FETCH_RECORD_QUERY,
+         {'record_id': 'record-7', 'block_num': block_num},
+         ('records_record_id_idx',)),
+        ('REST list records',
+         *list_query('records', 'record_id', rest_database.RECORD_FIELDS,
+                     rest_database.DEFAULT_RECORD_FIELDS),
+         ('records_block_range_idx', 'records_record_id_idx')),
+        ('REST list records page',
+         *list_query('records', 'record_id', rest_database.RECORD_FIELDS,
+                     rest_database.DEFAULT_RECORD_FIELDS,
+                     limit=100, after='record-7'),
+         ('records_record_id_idx',)),
+        ('REST list records by owner',
+         *list_query('records', 'record_id', rest_database.RECORD_FIELDS,
+                     rest_database.DEFAULT_RECORD_FIELDS,
+                     limit=100, filters={'owner': 'user-7'}),
+         ('records_current_owner_idx',)),
+        ('REST record locations',
+         rest_database.RECORD_HISTORY_QUERIES['locations'],
+         history_params,
+         ('record_locations_record_id_idx',)),
+        ('REST record owners',
+         rest_database.RECORD_HISTORY_QUERIES['owners'],
+         history_params,
+         ('record_owners_record_id_idx',)),
+    ]
+
+
+def seed(database, record_count, block_count, history):
+    """Ingests block_count blocks, each changing every record and adding
+    record_count users
+    """
+    for block_num in range(block_count):
+        block_range = {'start_block_num': block_num,
+                       'end_block_num': MAX_BLOCK_NUMBER}
+        database.insert_block({'block_num': block_num,
+                               'block_id': str(block_num)})
+        database.insert_users([
+            dict(block_range, public_key='user-{}'.format(index),
+                 name='user', role='User', timestamp=block_num)
+            for index in range(block_num * record_count,
+                               (block_num + 1) * record_count)
+        ])
+        database.insert_records([
+            dict(block_range,
+                 record_id='record-{}'.format(index),
+                 name='record',
+                 price=str(block_num),
+                 isForSale=False,
+                 is_stolen=False,
+                 split_state=False,
+                 evicted_location_count=0,
+                 locations=[{'latitude': location, 'longitude': location,
+                             'timestamp': location}
+                            for location in range(history + block_num)],
+                 owners=[{'user_id': 'user-{}'.format((index + owner) % 100),
+                          'timestamp': owner}
+                         for owner in range(history + block_num)])
+            for index in range(record_count)
+        ])
+        database.commit()
+
+
+def get_index_names(plan):
+    names = set()
+    if 'Index Name' in plan:
+        names.add(plan['Index Name'])
+    for child in plan.get('Plans', []):
+        names |= get_index_names(child)
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--dsn',
+        default='dbname=infinity user=sawtooth password=sawtooth '
+                'host=localhost port=5432',
+        help='Connection string of the scratch database')
+    parser.add_argument(
+        '--records', type=int, default=5000,
+        help='Records and users added per block')
+    parser.add_argument(
+        '--blocks', type=int, default=10,
+        help='Blocks seeded, each one a new version of every record')
+    parser.add_argument(
+        '--history', type=int, default=5,
+        help='Locations and owners of every record in the first block')
+    opts = parser.parse_args()
+
+    connection = psycopg2.connect(opts.dsn)
+    with connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS {}'.format(', '.join(TABLES)))
+    connection.commit()
+
+    database = Database(opts.dsn)
+    database.connect()
+    database.create_tables()
+    database.create_indexes()
+    seed(database, opts.records, opts.blocks, opts.history)
+    database.disconnect()
+
+    queries = get_rest_queries(opts.blocks - 1) + [
+        (description, query, None, expected)
+        for description, query, expected in SUBSCRIBER_QUERIES
+    ]
+
+    failures = 0
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+        for description, query, params, expected in queries:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + query, params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            used = get_index_names(plan[0]['Plan'])
+            passed = bool(used.intersection(expected))
+            failures += not passed
+            print('{:<6} {:<32} {}'.format(
+                'ok' if passed else 'FAIL',
+                description,
+                ', '.join(sorted(used)) or 'no index'))
+    connection.rollback()
+    connection.close()
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
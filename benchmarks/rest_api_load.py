@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Load test for the read endpoints of a running Infinity REST API. Issues
+GET requests from a number of concurrent clients and reports requests/sec
+and p50/p99 latency per path and concurrency, showing how list and fetch
+endpoints scale with the size of the database pool
+(infinity-rest-api --db-pool-max).
+
+    python3 benchmarks/rest_api_load.py --url http://localhost:8000 \\
+        --concurrency 1 8 32
+"""
+import argparse
+import asyncio
+import itertools
+import time
+
+import aiohttp
+
+
+# Fetch paths are filled with ids listed by the matching list path
+PATHS = ('/users', '/records', '/users/{public_key}', '/records/{record_id}')
+ID_SOURCES = {'public_key': '/users', 'record_id': '/records'}
+
+
+async def fetch_ids(session, url):
+    ids = {}
+    for key, path in ID_SOURCES.items():
+        async with session.get(url + path) as response:
+            response.raise_for_status()
+            resources = await response.json()
+        ids[key] = [resource[key] for resource in resources] or ['unknown']
+    return ids
+
+
+async def run_client(session, urls, deadline, samples):
+    for url in urls:
+        if time.perf_counter() >= deadline:
+            return
+        start = time.perf_counter()
+        async with session.get(url) as response:
+            await response.read()
+            response.raise_for_status()
+        samples.append(time.perf_counter() - start)
+
+
+def percentile(sorted_samples, fraction):
+    index = min(len(sorted_samples) - 1, int(len(sorted_samples) * fraction))
+    return sorted_samples[index]
+
+
+async def measure(session, url, path, ids, concurrency, duration):
+    key = next((key for key in ID_SOURCES if '{' + key + '}' in path), None)
+    values = ids[key] if key else [None]
+    samples = []
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        run_client(
+            session,
+            (url + path.format(**{key: value}) if key else url + path
+             for value in itertools.cycle(values[client::concurrency]
+                                          or values)),
+            deadline,
+            samples)
+        for client in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    samples.sort()
+    return (len(samples) / elapsed,
+            percentile(samples, 0.50),
+            percentile(samples, 0.99))
+
+
+async def run(opts):
+    connector = aiohttp.TCPConnector(limit=max(opts.concurrency))
+    async with aiohttp.ClientSession(connector=connector) as session:
+        ids = await fetch_ids(session, opts.url)
+        print('{:<24} {:>11} {:>10} {:>10} {:>10}'.format(
+            'path', 'concurrency', 'req/sec', 'p50 ms', 'p99 ms'))
+        for path in opts.paths:
+            for concurrency in opts.concurrency:
+                rate, p50, p99 = await measure(
+                    session, opts.url, path, ids, concurrency, opts.duration)
+                print('{:<24} {:>11} {:>10.1f} {:>10.2f} {:>10.2f}'.format(
+                    path, concurrency, rate, p50 * 1000, p99 * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--url', default='http://localhost:8000',
+        help='Base url of the REST API')
+    parser.add_argument(
+        '--paths', nargs='+', default=PATHS,
+        help='Paths to load')
+    parser.add_argument(
+        '--concurrency', type=int, nargs='+', default=[1, 4, 16, 64],
+        help='Numbers of concurrent clients to measure')
+    parser.add_argument(
+        '--duration', type=float, default=10,
+        help='Seconds each path and concurrency is loaded for')
+    opts = parser.parse_args()
+
+    asyncio.get_event_loop().run_until_complete(run(opts))
+
+
+if __name__ == '__main__':
+    main()
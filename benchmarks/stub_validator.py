@@ -0,0 +1,248 @@
+"""In-memory stand-ins for the validator side of the transaction processor
+interface, so InfinityHandler.apply can be driven without a validator.
+Requires the generated protobuf classes (run infinity-protogen first).
+"""
+import collections
+import itertools
+import os
+import sys
+import time
+
+import zmq
+
+from sawtooth_sdk.protobuf import processor_pb2
+from sawtooth_sdk.protobuf import state_context_pb2
+from sawtooth_sdk.protobuf import transaction_pb2
+from sawtooth_sdk.protobuf.validator_pb2 import Message
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(TOP_DIR, 'addressing'))
+sys.path.insert(0, os.path.join(TOP_DIR, 'processor'))
+sys.path.insert(0, os.path.join(TOP_DIR, 'protobuf'))
+sys.path.insert(0, os.path.join(TOP_DIR, 'rest_api'))
+sys.path.insert(0, os.path.join(TOP_DIR, 'subscriber'))
+
+from infinity_addressing import addresser  # noqa: E402 pylint: disable=wrong-import-position
+from infinity_protobuf import payload_pb2  # noqa: E402 pylint: disable=wrong-import-position
+
+
+MAX_OCCUPANCY = 10
+
+
+class StubEntry(object):
+    def __init__(self, address, data):
+        self.address = address
+        self.data = data
+
+
+class StubContext(object):
+    """Dict-backed replacement for sawtooth_sdk's Context. Each get_state
+    and set_state call sleeps for latency seconds to model the round trip
+    to the validator.
+    """
+    def __init__(self, latency=0.0, state=None):
+        self.state = {} if state is None else dict(state)
+        self.latency = latency
+        self.get_state_calls = 0
+        self.set_state_calls = 0
+
+    def get_state(self, addresses, timeout=None):
+        self.get_state_calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [StubEntry(address, self.state[address])
+                for address in addresses if address in self.state]
+
+    def set_state(self, entries, timeout=None):
+        self.set_state_calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        self.state.update(entries)
+        return list(entries)
+
+
+class StubValidator(object):
+    """Serves the validator end of the transaction processor protocol on a
+    local zmq ROUTER socket, so real TransactionProcessor workers can be
+    driven without a network. Every worker reads and writes the same state
+    dict. Transactions are handed out in order, at most MAX_OCCUPANCY per
+    worker, and never while an earlier one with the same key is in flight.
+    """
+    def __init__(self, state=None):
+        self.state = {} if state is None else dict(state)
+        self._zmq_context = zmq.Context()
+        self._socket = self._zmq_context.socket(zmq.ROUTER)
+        self._socket.setsockopt(zmq.LINGER, 0)
+        port = self._socket.bind_to_random_port('tcp://127.0.0.1')
+        self.url = 'tcp://127.0.0.1:{}'.format(port)
+        self._correlation_ids = (str(index) for index in itertools.count())
+        self._occupancy = collections.OrderedDict()
+        self._in_flight = {}
+        self._rejected = 0
+
+    def wait_for_workers(self, count):
+        """Blocks until count workers have registered"""
+        while len(self._occupancy) < count:
+            self._receive()
+
+    def run(self, transactions):
+        """Sends transactions to the registered workers and blocks until
+        each one has been answered
+
+        Args:
+            transactions (list of tuple): (key, StubTransaction) pairs;
+                transactions sharing a key are applied one at a time
+        Returns:
+            int: Number of transactions the workers rejected
+        """
+        self._rejected = 0
+        pending = collections.deque(transactions)
+        while pending or self._in_flight:
+            while pending and pending[0][0] not in self._in_flight.values():
+                worker = min(self._occupancy, key=self._occupancy.get)
+                if self._occupancy[worker] >= MAX_OCCUPANCY:
+                    break
+                key, transaction = pending.popleft()
+                correlation_id = self._send_process_request(
+                    worker, transaction)
+                self._in_flight[correlation_id] = key
+                self._occupancy[worker] += 1
+            self._receive()
+        return self._rejected
+
+    def close(self):
+        self._socket.close()
+        self._zmq_context.term()
+
+    def _send(self, worker, message_type, content, correlation_id):
+        self._socket.send_multipart([worker, Message(
+            message_type=message_type,
+            correlation_id=correlation_id,
+            content=content.SerializeToString()).SerializeToString()])
+
+    def _send_process_request(self, worker, transaction):
+        correlation_id = next(self._correlation_ids)
+        header = transaction_pb2.TransactionHeader(
+            family_name=addresser.FAMILY_NAME,
+            family_version=addresser.FAMILY_VERSION,
+            signer_public_key=transaction.header.signer_public_key)
+        self._send(
+            worker,
+            Message.TP_PROCESS_REQUEST,
+            processor_pb2.TpProcessRequest(
+                header=header,
+                payload=transaction.payload,
+                context_id=correlation_id),
+            correlation_id)
+        return correlation_id
+
+    def _receive(self):
+        worker, data = self._socket.recv_multipart()
+        message = Message()
+        message.ParseFromString(data)
+
+        if message.message_type == Message.TP_REGISTER_REQUEST:
+            request = processor_pb2.TpRegisterRequest()
+            request.ParseFromString(message.content)
+            self._occupancy.setdefault(worker, 0)
+            self._send(
+                worker,
+                Message.TP_REGISTER_RESPONSE,
+                processor_pb2.TpRegisterResponse(
+                    status=processor_pb2.TpRegisterResponse.OK,
+                    protocol_version=request.protocol_version),
+                message.correlation_id)
+        elif message.message_type == Message.TP_STATE_GET_REQUEST:
+            request = state_context_pb2.TpStateGetRequest()
+            request.ParseFromString(message.content)
+            self._send(
+                worker,
+                Message.TP_STATE_GET_RESPONSE,
+                state_context_pb2.TpStateGetResponse(
+                    entries=[
+                        state_context_pb2.TpStateEntry(
+                            address=address, data=self.state[address])
+                        for address in request.addresses
+                        if address in self.state
+                    ],
+                    status=state_context_pb2.TpStateGetResponse.OK),
+                message.correlation_id)
+        elif message.message_type == Message.TP_STATE_SET_REQUEST:
+            request = state_context_pb2.TpStateSetRequest()
+            request.ParseFromString(message.content)
+            for entry in request.entries:
+                self.state[entry.address] = entry.data
+            self._send(
+                worker,
+                Message.TP_STATE_SET_RESPONSE,
+                state_context_pb2.TpStateSetResponse(
+                    addresses=[entry.address for entry in request.entries],
+                    status=state_context_pb2.TpStateSetResponse.OK),
+                message.correlation_id)
+        elif message.message_type == Message.TP_PROCESS_RESPONSE:
+            response = processor_pb2.TpProcessResponse()
+            response.ParseFromString(message.content)
+            if response.status != processor_pb2.TpProcessResponse.OK:
+                self._rejected += 1
+            del self._in_flight[message.correlation_id]
+            self._occupancy[worker] -= 1
+
+
+class StubHeader(object):
+    def __init__(self, signer_public_key):
+        self.signer_public_key = signer_public_key
+
+
+class StubTransaction(object):
+    def __init__(self, signer_public_key, payload):
+        self.header = StubHeader(signer_public_key)
+        self.payload = payload
+
+
+def make_transaction(signer_public_key, action, field, data, timestamp=None):
+    """Builds a transaction carrying an InfinityPayload
+
+    Args:
+        signer_public_key (str): Public key of the transaction signer
+        action (int): An InfinityPayload.Action value
+        field (str): Name of the payload field holding data
+        data (message): The action message, e.g. a CreateUserAction
+        timestamp (int, optional): Unix UTC timestamp, defaults to now
+    """
+    payload = payload_pb2.InfinityPayload(
+        action=action,
+        timestamp=int(time.time()) if timestamp is None else timestamp)
+    getattr(payload, field).CopyFrom(data)
+    return StubTransaction(signer_public_key, payload.SerializeToString())
+
+
+def make_create_user(public_key):
+    return make_transaction(
+        public_key,
+        payload_pb2.InfinityPayload.CREATE_USER,
+        'create_user',
+        payload_pb2.CreateUserAction(name=public_key, role='User'))
+
+
+def make_create_record(public_key, record_id):
+    return make_transaction(
+        public_key,
+        payload_pb2.InfinityPayload.CREATE_RECORD,
+        'create_record',
+        payload_pb2.CreateRecordAction(
+            record_id=record_id,
+            name=record_id,
+            price='0',
+            latitude=0,
+            longitude=0))
+
+
+def make_update_record_location(public_key, record_id, latitude, longitude):
+    return make_transaction(
+        public_key,
+        payload_pb2.InfinityPayload.UPDATE_RECORD_LOCATION,
+        'update_record_location',
+        payload_pb2.UpdateRecordLocationAction(
+            record_id=record_id,
+            latitude=latitude,
+            longitude=longitude))
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""Compares the blocks/sec the subscriber ingests with the per-block bulk
+statements of Database against one INSERT per user, record, location and
+owner, and the rows each path leaves in the tables. The bulk path only
+writes the locations and owners a block adds, so rows/sec would not be
+comparable. Runs against a real postgres database whose subscriber
+tables are dropped and recreated, so point it at a scratch database.
+
+    python3 benchmarks/subscriber_ingest.py --records 100 --history 1000
+"""
+import argparse
+import time
+
+import psycopg2
+
+import stub_validator  # noqa: F401 pylint: disable=unused-import
+from infinity_subscriber.database import Database
+from infinity_subscriber.database import MAX_BLOCK_NUMBER
+
+
+TABLES = ('blocks', 'auth', 'records', 'record_locations', 'record_owners',
+          'users')
+
+
+class RowByRowDatabase(Database):
+    """Database as it was before bulk ingestion, executing one statement
+    per row
+    """
+    def insert_users(self, user_dicts):
+        with self._conn.cursor() as cursor:
+            for user in user_dicts:
+                cursor.execute("""
+                UPDATE users SET end_block_num = {}
+                WHERE end_block_num = {} AND public_key = '{}'
+                """.format(user['start_block_num'],
+                           user['end_block_num'],
+                           user['public_key']))
+                cursor.execute("""
+                INSERT INTO users (public_key, name, role, timestamp,
+                start_block_num, end_block_num)
+                VALUES ('{}', '{}', '{}', '{}', '{}', '{}');
+                """.format(user['public_key'], user['name'], user['role'],
+                           user['timestamp'], user['start_block_num'],
+                           user['end_block_num']))
+
+    def insert_records(self, record_dicts, status_dicts=()):
+        for record in record_dicts:
+            with self._conn.cursor() as cursor:
+                cursor.execute("""
+                UPDATE records SET end_block_num = {}
+                WHERE end_block_num = {} AND record_id = '{}'
+                """.format(record['start_block_num'],
+                           record['end_block_num'],
+                           record['record_id']))
+                cursor.execute("""
+                INSERT INTO records (record_id, name, price, isForSale,
+                is_stolen, start_block_num, end_block_num)
+                VALUES ('{}', '{}', '{}','{}', '{}', '{}', '{}');
+                """.format(record['record_id'], record['name'],
+                           record['price'], record['isForSale'],
+                           record['is_stolen'], record['start_block_num'],
+                           record['end_block_num']))
+            self._insert_rows(
+                record, 'record_locations',
+                ('latitude', 'longitude', 'timestamp'), record['locations'])
+            self._insert_rows(
+                record, 'record_owners',
+                ('user_id', 'timestamp'), record['owners'])
+
+    def _insert_rows(self, record, table, columns, entries):
+        with self._conn.cursor() as cursor:
+            cursor.execute("""
+            UPDATE {} SET end_block_num = {}
+            WHERE end_block_num = {} AND record_id = '{}'
+            """.format(table, record['start_block_num'],
+                       record['end_block_num'], record['record_id']))
+            for entry in entries:
+                cursor.execute("""
+                INSERT INTO {} (record_id, {}, start_block_num, end_block_num)
+                VALUES ('{}', {}, '{}', '{}');
+                """.format(table,
+                           ', '.join(columns),
+                           record['record_id'],
+                           ', '.join("'{}'".format(entry[column])
+                                     for column in columns),
+                           record['start_block_num'],
+                           record['end_block_num']))
+
+
+def make_block(block_num, record_count, history):
+    """Returns the users and records changed in one block, as decoded by
+    infinity_subscriber.decoding
+    """
+    block_range = {'start_block_num': block_num,
+                   'end_block_num': MAX_BLOCK_NUMBER}
+    users = [dict(block_range, public_key='user-{}'.format(block_num),
+                  name='user', role='User', timestamp=block_num)]
+    records = [
+        dict(block_range,
+             record_id='record-{}'.format(index),
+             name='record',
+             price='1',
+             isForSale=False,
+             is_stolen=False,
+             split_state=False,
+             evicted_location_count=0,
+             locations=[{'latitude': location, 'longitude': location,
+                         'timestamp': location}
+                        for location in range(history + block_num)],
+             owners=[{'user_id': 'user', 'timestamp': owner}
+                     for owner in range(history + block_num)])
+        for index in range(record_count)
+    ]
+    return users, records
+
+
+def count_rows(connection):
+    """Returns the number of rows stored in the subscriber tables"""
+    with connection.cursor() as cursor:
+        cursor.execute(' UNION ALL '.join(
+            'SELECT count(*) FROM {}'.format(table) for table in TABLES))
+        return sum(count for count, in cursor.fetchall())
+
+
+def measure(database_class, dsn, blocks):
+    connection = psycopg2.connect(dsn)
+    with connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS {}'.format(', '.join(TABLES)))
+    connection.commit()
+    connection.close()
+
+    database = database_class(dsn)
+    database.connect()
+    database.create_tables()
+
+    start = time.perf_counter()
+    for block_num, (users, records) in enumerate(blocks):
+        database.insert_block({'block_num': block_num,
+                               'block_id': str(block_num)})
+        database.insert_users(users)
+        database.insert_records(records)
+        database.commit()
+    elapsed = time.perf_counter() - start
+
+    database.disconnect()
+
+    connection = psycopg2.connect(dsn)
+    rows = count_rows(connection)
+    connection.close()
+    return len(blocks) / elapsed, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--dsn',
+        default='dbname=infinity user=sawtooth password=sawtooth '
+                'host=localhost port=5432',
+        help='Connection string of the scratch database')
+    parser.add_argument(
+        '--records', type=int, default=100,
+        help='Records changed in every block')
+    parser.add_argument(
+        '--history', type=int, default=1000,
+        help='Locations and owners of every record in the first block')
+    parser.add_argument(
+        '--blocks', type=int, default=5,
+        help='Blocks ingested per measurement')
+    opts = parser.parse_args()
+
+    blocks = [make_block(block_num, opts.records, opts.history)
+              for block_num in range(opts.blocks)]
+
+    row_by_row, row_by_row_rows = measure(RowByRowDatabase, opts.dsn, blocks)
+    bulk, bulk_rows = measure(Database, opts.dsn, blocks)
+    print('{:<12} {:>12} {:>12}'.format('path', 'blocks/sec', 'rows stored'))
+    print('{:<12} {:>12.2f} {:>12}'.format(
+        'row-by-row', row_by_row, row_by_row_rows))
+    print('{:<12} {:>12.2f} {:>12} {:>7.2f}x'.format(
+        'bulk', bulk, bulk_rows, bulk / row_by_row))
+
+
+if __name__ == '__main__':
+    main()
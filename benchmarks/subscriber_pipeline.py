@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Compares how fast the subscriber catches up on a backlog of blocks when
+each block is decoded and written in turn (Subscriber) against decoding
+ahead in worker processes (PipelinedSubscriber, infinity-subscriber
+subscribe --decode-workers). Blocks are replayed from memory instead of a
+validator, into a scratch postgres database whose subscriber tables are
+dropped and recreated.
+
+    python3 benchmarks/subscriber_pipeline.py --workers 1 2 4
+"""
+import argparse
+from concurrent import futures
+import os
+import sys
+import time
+
+import psycopg2
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(TOP_DIR, 'addressing'))
+sys.path.insert(0, os.path.join(TOP_DIR, 'protobuf'))
+sys.path.insert(0, os.path.join(TOP_DIR, 'subscriber'))
+
+# pylint: disable=wrong-import-position
+from infinity_addressing import addresser
+from infinity_protobuf import record_pb2
+from infinity_subscriber.database import Database
+from infinity_subscriber.event_handling import decode_event_list
+from infinity_subscriber.event_handling import get_decoded_block_handler
+from infinity_subscriber.event_handling import get_events_handler
+from infinity_subscriber.subscriber import PipelinedSubscriber
+from infinity_subscriber.subscriber import Subscriber
+from sawtooth_sdk.protobuf.events_pb2 import Event
+from sawtooth_sdk.protobuf.events_pb2 import EventList
+from sawtooth_sdk.protobuf.transaction_receipt_pb2 import StateChange
+from sawtooth_sdk.protobuf.transaction_receipt_pb2 import StateChangeList
+
+
+TABLES = ('blocks', 'auth', 'records', 'record_locations', 'record_owners',
+          'users')
+
+
+class StubMessage(object):
+    def __init__(self, content):
+        self.content = content
+
+
+class StubStream(object):
+    """Replays serialized EventLists to a subscriber, stopping it after the
+    last one
+    """
+    def __init__(self, subscriber, event_lists):
+        self._subscriber = subscriber
+        self._event_lists = list(event_lists)
+
+    def receive(self):
+        future = futures.Future()
+        future.set_result(StubMessage(self._event_lists.pop(0)))
+        if not self._event_lists:
+            self._subscriber._is_active = False
+        return future
+
+
+def make_event_list(block_num, record_count, history):
+    """Returns the serialized EventList of a block changing every record,
+    each with history locations and owners
+    """
+    changes = [
+        StateChange(
+            address=addresser.get_record_address(record_id),
+            value=record_pb2.RecordContainer(entries=[record_pb2.Record(
+                record_id=record_id,
+                name='record',
+                locations=[
+                    record_pb2.Record.Location(
+                        latitude=index, longitude=index, timestamp=index)
+                    for index in range(history + block_num)],
+                owners=[
+                    record_pb2.Record.Owner(user_id='user', timestamp=index)
+                    for index in range(history + block_num)])
+            ]).SerializeToString(),
+            type=StateChange.SET)
+        for record_id in ('record-{}'.format(index)
+                          for index in range(record_count))
+    ]
+    return EventList(events=[
+        Event(event_type='sawtooth/block-commit', attributes=[
+            Event.Attribute(key='block_num', value=str(block_num)),
+            Event.Attribute(key='block_id', value=str(block_num))]),
+        Event(event_type='sawtooth/state-delta',
+              data=StateChangeList(
+                  state_changes=changes).SerializeToString()),
+    ]).SerializeToString()
+
+
+def measure(dsn, event_lists, workers, queue_size):
+    connection = psycopg2.connect(dsn)
+    with connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS {}'.format(', '.join(TABLES)))
+    connection.commit()
+    connection.close()
+
+    database = Database(dsn)
+    database.connect()
+    database.create_tables()
+    database.create_indexes()
+
+    # Skip Subscriber.__init__, which connects to a validator
+    if workers:
+        subscriber = PipelinedSubscriber.__new__(PipelinedSubscriber)
+        subscriber._decoder = decode_event_list
+        subscriber._workers = workers
+        subscriber._queue_size = queue_size
+        subscriber._writer_error = None
+        handler = get_decoded_block_handler(database)
+    else:
+        subscriber = Subscriber.__new__(Subscriber)
+        handler = get_events_handler(database)
+    subscriber._event_handlers = [handler]
+    subscriber._stream = StubStream(subscriber, event_lists)
+    subscriber._is_active = True
+
+    start = time.perf_counter()
+    subscriber._receive_events()
+    elapsed = time.perf_counter() - start
+
+    database.disconnect()
+    return len(event_lists) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--dsn',
+        default='dbname=infinity user=sawtooth password=sawtooth '
+                'host=localhost port=5432',
+        help='Connection string of the scratch database')
+    parser.add_argument(
+        '--workers', type=int, nargs='+', default=[1, 2, 4],
+        help='Decoding worker counts to measure')
+    parser.add_argument(
+        '--queue-size', type=int, default=64,
+        help='Blocks decoded ahead of the database writes')
+    parser.add_argument(
+        '--blocks', type=int, default=200,
+        help='Blocks in the backlog')
+    parser.add_argument(
+        '--records', type=int, default=20,
+        help='Records changed in every block')
+    parser.add_argument(
+        '--history', type=int, default=200,
+        help='Locations and owners of every record in the first block')
+    opts = parser.parse_args()
+
+    event_lists = [make_event_list(block_num, opts.records, opts.history)
+                   for block_num in range(opts.blocks)]
+
+    baseline = measure(opts.dsn, event_lists, 0, opts.queue_size)
+    print('{:>8} {:>12} {:>8}'.format('workers', 'blocks/sec', 'speedup'))
+    print('{:>8} {:>12.1f} {:>7.2f}x'.format('serial', baseline, 1))
+    for workers in opts.workers:
+        rate = measure(opts.dsn, event_lists, workers, opts.queue_size)
+        print('{:>8} {:>12.1f} {:>7.2f}x'.format(
+            workers, rate, rate / baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,16 @@
 
-import datetime
+import collections
+import logging
 import time
 
 from sawtooth_sdk.processor.handler import TransactionHandler
+from sawtooth_sdk.processor.exceptions import AuthorizationException
 from sawtooth_sdk.processor.exceptions import InvalidTransaction
 
 
 from infinity_addressing import addresser
+from infinity_addressing import clock
+from infinity_addressing import layout
 
 from infinity_protobuf import payload_pb2
 from infinity_tp.payload import InfinityPayload
@@ -18,9 +22,42 @@ MAX_LAT = 90 * 1e6
 MIN_LAT = -90 * 1e6
 MAX_LNG = 180 * 1e6
 MIN_LNG = -180 * 1e6
+LOGGER = logging.getLogger(__name__)
 
 
 class InfinityHandler(TransactionHandler):
+    def __init__(self,
+                 max_locations=0,
+                 metrics=None,
+                 sync_tolerance=SYNC_TOLERANCE,
+                 max_age=0,
+                 state_layout=layout.CONTAINER,
+                 split_record_state=False):
+        """
+        Args:
+            max_locations (int): Number of most recent locations kept on
+                each record, 0 for unlimited. Must be the same on every
+                node of the network
+            metrics (infinity_tp.metrics.ProcessorMetrics, optional):
+                Collector that every apply is reported to
+            sync_tolerance (int): Seconds a payload timestamp may be ahead
+                of local time
+            max_age (int): Seconds a payload timestamp may be behind local
+                time, 0 to accept payloads of any age
+            state_layout (str): Layout new state is written in, one of
+                infinity_addressing.layout.STATE_LAYOUTS. Must be the same
+                on every node of the network
+            split_record_state (bool): Whether new records keep their
+                status and locations at separate addresses. Must be the
+                same on every node and cannot be turned off again
+        """
+        self._max_locations = max_locations
+        self._sync_tolerance = sync_tolerance
+        self._max_age = max_age
+        self._state_layout = state_layout
+        self._split_record_state = split_record_state
+        self._metrics = metrics
+        self._outcomes = collections.Counter()
 
     @property
     def family_name(self):
@@ -35,11 +72,53 @@ class InfinityHandler(TransactionHandler):
         return [addresser.NAMESPACE]
 
     def apply(self, transaction, context):
-        header = transaction.header
         payload = InfinityPayload(transaction.payload)
-        state = InfinityState(context)
 
-        _validate_timestamp(payload.timestamp)
+        trace = LOGGER.isEnabledFor(logging.DEBUG)
+        if not trace and self._metrics is None:
+            self._apply(transaction.header, payload, self._new_state(context))
+            return
+
+        if self._metrics is not None:
+            context = self._metrics.instrument_context(context)
+        state = self._new_state(context)
+
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            self._apply(transaction.header, payload, state)
+            outcome = 'ok'
+        except (InvalidTransaction, AuthorizationException) as err:
+            outcome = 'invalid'
+            if self._metrics is not None:
+                self._metrics.observe_invalid(
+                    _action_name(payload.action), err)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            if trace:
+                self._trace(
+                    payload.action, outcome, elapsed, state.state_reads)
+            if self._metrics is not None:
+                self._metrics.observe_apply(
+                    _action_name(payload.action),
+                    len(transaction.payload),
+                    elapsed)
+
+    def _new_state(self, context):
+        return InfinityState(
+            context,
+            max_locations=self._max_locations,
+            state_layout=self._state_layout,
+            split_record_state=self._split_record_state)
+
+    def _apply(self, header, payload, state):
+        _validate_timestamp(
+            payload.timestamp, self._sync_tolerance, self._max_age)
+
+        state.prefetch(_get_addresses(
+            header.signer_public_key, payload, self._split_record_state))
+        state.prefetch(_get_split_record_addresses(state, payload))
 
         if payload.action == payload_pb2.InfinityPayload.CREATE_USER:
             _create_user(
@@ -71,9 +150,124 @@ class InfinityHandler(TransactionHandler):
                 state=state,
                 public_key=header.signer_public_key,
                 payload=payload)
+        elif payload.action == \
+                payload_pb2.InfinityPayload.BATCH_UPDATE_RECORD_LOCATIONS:
+            _batch_update_record_locations(
+                state=state,
+                public_key=header.signer_public_key,
+                payload=payload)
+        elif payload.action == \
+                payload_pb2.InfinityPayload.BATCH_CREATE_RECORDS:
+            _batch_create_records(
+                state=state,
+                public_key=header.signer_public_key,
+                payload=payload)
         else:
             raise InvalidTransaction('Unhandled action')
 
+        state.flush()
+
+    def _trace(self, action, outcome, elapsed, state_reads):
+        """Logs the timing, get_state round trips and running outcome
+        count of a single apply. Only called when debug logging is enabled.
+        """
+        action_name = _action_name(action)
+        self._outcomes[(action_name, outcome)] += 1
+        LOGGER.debug(
+            'apply action=%s outcome=%s elapsed_ms=%.3f state_reads=%d '
+            'count=%d',
+            action_name,
+            outcome,
+            elapsed * 1000,
+            state_reads,
+            self._outcomes[(action_name, outcome)])
+
+
+def _action_name(action):
+    if action in payload_pb2.InfinityPayload.Action.values():
+        return payload_pb2.InfinityPayload.Action.Name(action)
+    return str(action)
+
+
+def _get_addresses(public_key, payload, split_record_state):
+    """Returns every state address the transaction reads, so they can be
+    fetched from the validator in one round trip
+    """
+    if payload.action == payload_pb2.InfinityPayload.CREATE_USER:
+        return [addresser.get_user_address(public_key)]
+    if payload.action == payload_pb2.InfinityPayload.CREATE_RECORD:
+        return [addresser.get_user_address(public_key)] + \
+            _get_record_addresses(
+                [payload.data.record_id], split_record_state,
+                status=True, locations=True)
+    if payload.action == payload_pb2.InfinityPayload.TRANSFER_RECORD:
+        return [addresser.get_user_address(payload.data.receiving_user),
+                addresser.get_record_address(payload.data.record_id)]
+    if payload.action in (
+            payload_pb2.InfinityPayload.UPDATE_RECORD_LOCATION,
+            payload_pb2.InfinityPayload.UPDATE_RECORD_FOR_SALE,
+            payload_pb2.InfinityPayload.UPDATE_RECORD_STOLEN):
+        return [addresser.get_record_address(payload.data.record_id)]
+    if payload.action == \
+            payload_pb2.InfinityPayload.BATCH_UPDATE_RECORD_LOCATIONS:
+        return addresser.get_record_addresses(
+            [update.record_id for update in payload.data.updates])
+    if payload.action == payload_pb2.InfinityPayload.BATCH_CREATE_RECORDS:
+        return [addresser.get_user_address(public_key)] + \
+            _get_record_addresses(
+                [record.record_id for record in payload.data.records],
+                split_record_state,
+                status=True,
+                locations=True)
+    return []
+
+
+def _get_split_record_addresses(state, payload):
+    """Returns the status or locations addresses the transaction reads of
+    the records it updates that have split state.
+
+    Whether a record has split state is only known from the record
+    itself, so these are read in a second get_state after it. For the
+    same reason clients list both the record and its status or locations
+    address as outputs of every update, which keeps updates of one record
+    serialized by the scheduler even when only the split address changes.
+    """
+    if payload.action == payload_pb2.InfinityPayload.UPDATE_RECORD_LOCATION:
+        record_ids = [payload.data.record_id]
+        get_address = addresser.get_record_locations_address
+    elif payload.action in (
+            payload_pb2.InfinityPayload.UPDATE_RECORD_FOR_SALE,
+            payload_pb2.InfinityPayload.UPDATE_RECORD_STOLEN):
+        record_ids = [payload.data.record_id]
+        get_address = addresser.get_record_status_address
+    elif payload.action == \
+            payload_pb2.InfinityPayload.BATCH_UPDATE_RECORD_LOCATIONS:
+        record_ids = [update.record_id for update in payload.data.updates]
+        get_address = addresser.get_record_locations_address
+    else:
+        return []
+
+    addresses = []
+    for record_id in dict.fromkeys(record_ids):
+        record = state.get_record(record_id)
+        if record is not None and record.split_state:
+            addresses.append(get_address(record_id))
+    return addresses
+
+
+def _get_record_addresses(record_ids,
+                          split_record_state,
+                          status=False,
+                          locations=False):
+    addresses = addresser.get_record_addresses(record_ids)
+    if split_record_state and status:
+        addresses += [addresser.get_record_status_address(record_id)
+                      for record_id in record_ids]
+    if split_record_state and locations:
+        addresses += [addresser.get_record_locations_address(record_id)
+                      for record_id in record_ids]
+    return addresses
+
 
 def _create_user(state, public_key, payload):
 
@@ -88,9 +282,6 @@ def _create_user(state, public_key, payload):
 
 
 def _create_record(state, public_key, payload):
-    print(payload)
-    print("Price")
-    print(payload.data.price)
     if state.get_user(public_key) is None:
         raise InvalidTransaction('User with the public key {} does '
                                  'not exist'.format(public_key))
@@ -117,10 +308,10 @@ def _create_record(state, public_key, payload):
 
 
 def _transfer_record(state, public_key, payload):
-    if state.get_user(payload.data.receiving_agent) is None:
+    if state.get_user(payload.data.receiving_user) is None:
         raise InvalidTransaction(
             'User with the public key {} does '
-            'not exist'.format(payload.data.receiving_agent))
+            'not exist'.format(payload.data.receiving_user))
 
     record = state.get_record(payload.data.record_id)
     if record is None:
@@ -133,7 +324,7 @@ def _transfer_record(state, public_key, payload):
             'Transaction signer is not the owner of the record')
 
     state.transfer_record(
-        receiving_agent=payload.data.receiving_agent,
+        receiving_user=payload.data.receiving_user,
         record_id=payload.data.record_id,
         timestamp=payload.timestamp)
 
@@ -152,6 +343,55 @@ def _update_record_location(state, public_key, payload):
         record_id=payload.data.record_id,
         timestamp=payload.timestamp)
 
+
+def _batch_update_record_locations(state, public_key, payload):
+    if not payload.data.updates:
+        raise InvalidTransaction('No location updates provided')
+
+    for update in payload.data.updates:
+        if state.get_record(update.record_id) is None:
+            raise InvalidTransaction('Record with the record id {} does not '
+                                     'exist'.format(update.record_id))
+
+        _validate_latlng(update.latitude, update.longitude)
+
+        state.update_record_location(
+            latitude=update.latitude,
+            longitude=update.longitude,
+            record_id=update.record_id,
+            timestamp=payload.timestamp)
+
+
+def _batch_create_records(state, public_key, payload):
+    if not payload.data.records:
+        raise InvalidTransaction('No records provided')
+
+    if state.get_user(public_key) is None:
+        raise InvalidTransaction('User with the public key {} does '
+                                 'not exist'.format(public_key))
+
+    for record in payload.data.records:
+        if record.record_id == '':
+            raise InvalidTransaction('No record ID provided')
+
+        if state.get_record(record.record_id):
+            raise InvalidTransaction('Identifier {} belongs to an existing '
+                                     'record'.format(record.record_id))
+
+        _validate_latlng(record.latitude, record.longitude)
+
+        state.set_record(
+            public_key=public_key,
+            latitude=record.latitude,
+            longitude=record.longitude,
+            record_id=record.record_id,
+            name=record.name,
+            imageUrl=record.imageUrl,
+            price=record.price,
+            isForSale=record.isForSale,
+            timestamp=payload.timestamp)
+
+
 def _update_record_is_for_sale(state, public_key, payload):
     record = state.get_record(payload.data.record_id)
     if record is None:
@@ -188,8 +428,7 @@ def _validate_record_owner(signer_public_key, record):
     """Validates that the public key of the signer is the latest (i.e.
     current) owner of the record
     """
-    latest_owner = max(record.owners, key=lambda obj: obj.timestamp).user_id
-    return latest_owner == signer_public_key
+    return record.current_owner == signer_public_key
 
 
 def _validate_latlng(latitude, longitude):
@@ -201,17 +440,22 @@ def _validate_latlng(latitude, longitude):
                                  'Got {}'.format(longitude/1e6))
 
 
-def _validate_timestamp(timestamp):
+def _validate_timestamp(timestamp, sync_tolerance, max_age):
     """Validates that the client submitted timestamp for a transaction is not
-    greater than current time, within a tolerance defined by SYNC_TOLERANCE
+    greater than current time, within a tolerance defined by sync_tolerance,
+    and, if max_age is set, not older than max_age seconds
 
     NOTE: Timestamp validation can be challenging since the machines that are
     submitting and validating transactions may have different system times
     """
-    dts = datetime.datetime.utcnow()
-    current_time = round(time.mktime(dts.timetuple()) + dts.microsecond/1e6)
-    if (timestamp - current_time) > SYNC_TOLERANCE:
+    current_time = clock.get_time()
+    if (timestamp - current_time) > sync_tolerance:
         raise InvalidTransaction(
             'Timestamp must be less than local time.'
             ' Expected {0} in ({1}-{2}, {1}+{2})'.format(
-                timestamp, current_time, SYNC_TOLERANCE))
+                timestamp, current_time, sync_tolerance))
+    if max_age and (current_time - timestamp) > max_age:
+        raise InvalidTransaction(
+            'Timestamp is too old.'
+            ' Expected {0} in ({1}-{2}, {1}+{3})'.format(
+                timestamp, current_time, max_age, sync_tolerance))
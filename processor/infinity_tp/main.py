@@ -1,10 +1,14 @@
 import argparse
+import multiprocessing
 import sys
 
 from sawtooth_sdk.processor.core import TransactionProcessor
 from sawtooth_sdk.processor.log import init_console_logging
 
+from infinity_addressing import layout
+
 from infinity_tp.handler import InfinityHandler
+from infinity_tp.handler import SYNC_TOLERANCE
 
 
 
@@ -17,11 +21,64 @@ def parse_args(args):
         default='tcp://localhost:4004',
         help='Endpoint for the validator connection')
 
+    parser.add_argument(
+        '--max-locations',
+        type=int,
+        default=0,
+        help='Number of most recent locations kept on each record; older\n'
+             'ones are compacted into a digest. 0 keeps every location.\n'
+             'Must be identical on every node of the network')
+
+    parser.add_argument(
+        '--state-layout',
+        choices=layout.STATE_LAYOUTS,
+        default=layout.CONTAINER,
+        help="Layout new state is written in. 'single' stores one user or\n"
+             "record per address and rejects hash collisions. Both\n"
+             'layouts are always readable. Must be identical on every node')
+
+    parser.add_argument(
+        '--split-record-state',
+        action='store_true',
+        help='Keep the status and locations of new records at their own\n'
+             'addresses, so updating them does not rewrite the record.\n'
+             'Updates of these records take a second state read. Must be\n'
+             'identical on every node and cannot be turned off')
+
+    parser.add_argument(
+        '--sync-tolerance',
+        type=int,
+        default=SYNC_TOLERANCE,
+        help='Seconds a transaction timestamp may be ahead of local time')
+
+    parser.add_argument(
+        '--max-age',
+        type=int,
+        default=0,
+        help='Reject transactions whose timestamp is more than this many\n'
+             'seconds behind local time. 0 disables the check. Nodes that\n'
+             'replay old blocks will reject them if this is set')
+
+    parser.add_argument(
+        '-w', '--workers',
+        type=int,
+        default=1,
+        help='Number of processor processes to register with the\n'
+             'validator, so transactions can be applied in parallel')
+
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        help='Serve Prometheus metrics on this port. Requires the\n'
+             'prometheus_client package. With several workers, worker N\n'
+             'serves on this port + N')
+
     parser.add_argument(
         '-v', '--verbose',
         action='count',
         default=0,
-        help='Increase output sent to stderr')
+        help='Increase output sent to stderr. -vv also traces the timing\n'
+             'and outcome of every transaction applied')
 
     return parser.parse_args(args)
 
@@ -30,12 +87,55 @@ def main(args=None):
     if args is None:
         args = sys.argv[1:]
     opts = parse_args(args)
+
+    if opts.workers <= 1:
+        run_processor(opts)
+        return
+
+    workers = [
+        multiprocessing.Process(
+            target=run_processor, args=(opts, index), daemon=True)
+        for index in range(opts.workers)
+    ]
+    try:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+
+def run_processor(opts, worker_index=0):
+    """Starts a TransactionProcessor with its own InfinityHandler and
+    blocks until it is stopped
+
+    Args:
+        opts (argparse.Namespace): The parsed command line options
+        worker_index (int): Position of this worker among --workers
+    """
     processor = None
     try:
         init_console_logging(verbose_level=opts.verbose)
 
+        metrics = None
+        if opts.metrics_port is not None:
+            from infinity_tp.metrics import ProcessorMetrics
+            metrics = ProcessorMetrics()
+            metrics.start_server(opts.metrics_port + worker_index)
+
         processor = TransactionProcessor(url=opts.connect)
-        handler = InfinityHandler()
+        handler = InfinityHandler(
+            max_locations=opts.max_locations,
+            metrics=metrics,
+            sync_tolerance=opts.sync_tolerance,
+            max_age=opts.max_age,
+            state_layout=opts.state_layout,
+            split_record_state=opts.split_record_state)
         processor.add_handler(handler)
         processor.start()
     except KeyboardInterrupt:
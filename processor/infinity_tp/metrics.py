@@ -0,0 +1,100 @@
+import time
+import traceback
+
+from prometheus_client import Counter
+from prometheus_client import Histogram
+from prometheus_client import start_http_server
+
+
+SIZE_BUCKETS = (
+    64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class ProcessorMetrics(object):
+    """Prometheus counters and histograms describing where the transaction
+    processor spends its time and which transactions it rejects
+    """
+    def __init__(self, registry=None):
+        kwargs = {} if registry is None else {'registry': registry}
+
+        self._apply_seconds = Histogram(
+            'infinity_tp_apply_seconds',
+            'Time spent applying a transaction',
+            ['action'],
+            **kwargs)
+        self._invalid_total = Counter(
+            'infinity_tp_invalid_transactions_total',
+            'Transactions rejected as invalid',
+            ['action', 'reason'],
+            **kwargs)
+        self._payload_bytes = Histogram(
+            'infinity_tp_payload_bytes',
+            'Size of transaction payloads',
+            buckets=SIZE_BUCKETS,
+            **kwargs)
+        self._state_seconds = Histogram(
+            'infinity_tp_state_seconds',
+            'Time spent in validator state calls',
+            ['call'],
+            **kwargs)
+        self._state_bytes = Histogram(
+            'infinity_tp_state_bytes',
+            'Bytes transferred by validator state calls',
+            ['call'],
+            buckets=SIZE_BUCKETS,
+            **kwargs)
+
+    def start_server(self, port):
+        """Serves the metrics over HTTP on the given port from a daemon
+        thread
+        """
+        start_http_server(port)
+
+    def instrument_context(self, context):
+        """Wraps a transaction context so its get_state and set_state calls
+        are timed and sized
+        """
+        return _InstrumentedContext(context, self)
+
+    def observe_apply(self, action_name, payload_size, elapsed):
+        self._apply_seconds.labels(action_name).observe(elapsed)
+        self._payload_bytes.observe(payload_size)
+
+    def observe_invalid(self, action_name, err):
+        """Counts a rejected transaction, using the name of the function
+        that raised it as the reason so label cardinality stays bounded
+        """
+        frames = traceback.extract_tb(err.__traceback__)
+        reason = frames[-1].name if frames else 'unknown'
+        self._invalid_total.labels(action_name, reason).inc()
+
+    def observe_state(self, call, elapsed, size):
+        self._state_seconds.labels(call).observe(elapsed)
+        self._state_bytes.labels(call).observe(size)
+
+
+class _InstrumentedContext(object):
+    def __init__(self, context, metrics):
+        self._context = context
+        self._metrics = metrics
+
+    def get_state(self, addresses, timeout=None):
+        start = time.perf_counter()
+        state_entries = self._context.get_state(addresses, timeout=timeout)
+        self._metrics.observe_state(
+            'get_state',
+            time.perf_counter() - start,
+            sum(len(entry.data) for entry in state_entries))
+        return state_entries
+
+    def set_state(self, entries, timeout=None):
+        start = time.perf_counter()
+        addresses = self._context.set_state(entries, timeout=timeout)
+        self._metrics.observe_state(
+            'set_state',
+            time.perf_counter() - start,
+            sum(len(data) for data in entries.values()))
+        return addresses
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
@@ -2,54 +2,52 @@ from sawtooth_sdk.processor.exceptions import InvalidTransaction
 from infinity_protobuf import payload_pb2
 
 
+# The payload field holding the action data, keyed by InfinityPayload.Action
+DATA_FIELDS = {
+    payload_pb2.InfinityPayload.CREATE_USER: 'create_user',
+    payload_pb2.InfinityPayload.CREATE_RECORD: 'create_record',
+    payload_pb2.InfinityPayload.TRANSFER_RECORD: 'transfer_record',
+    payload_pb2.InfinityPayload.UPDATE_RECORD_LOCATION:
+        'update_record_location',
+    payload_pb2.InfinityPayload.UPDATE_RECORD_FOR_SALE:
+        'update_record_for_sale',
+    payload_pb2.InfinityPayload.UPDATE_RECORD_STOLEN: 'update_record_stolen',
+    payload_pb2.InfinityPayload.BATCH_UPDATE_RECORD_LOCATIONS:
+        'batch_update_record_locations',
+    payload_pb2.InfinityPayload.BATCH_CREATE_RECORDS: 'batch_create_records',
+}
+
+
 class InfinityPayload(object):
+    __slots__ = ('_transaction', '_action', '_timestamp', '_data')
 
     def __init__(self, payload):
         self._transaction = payload_pb2.InfinityPayload()
         self._transaction.ParseFromString(payload)
+        self._action = self._transaction.action
+        self._timestamp = self._transaction.timestamp
+
+        field = DATA_FIELDS.get(self._action)
+        if field is not None and self._transaction.HasField(field):
+            self._data = getattr(self._transaction, field)
+        else:
+            self._data = None
 
     @property
     def action(self):
-        return self._transaction.action
+        return self._action
 
     @property
     def data(self):
-        if self._transaction.HasField('create_user') and \
-            self._transaction.action == \
-                payload_pb2.InfinityPayload.CREATE_USER:
-            return self._transaction.create_user
-
-        if self._transaction.HasField('create_record') and \
-            self._transaction.action == \
-                payload_pb2.InfinityPayload.CREATE_RECORD:
-            return self._transaction.create_record
-
-        if self._transaction.HasField('transfer_record') and \
-            self._transaction.action == \
-                payload_pb2.InfinityPayload.TRANSFER_RECORD:
-            return self._transaction.transfer_record
-
-        if self._transaction.HasField('update_record_location') and \
-            self._transaction.action == \
-                payload_pb2.InfinityPayload.UPDATE_RECORD_LOCATION:
-            return self._transaction.update_record_location
-        if self._transaction.HasField('update_record_for_sale') and \
-            self._transaction.action == \
-                payload_pb2.InfinityPayload.UPDATE_RECORD_FOR_SALE:
-            return self._transaction.update_record_for_sale
-
-        if self._transaction.HasField('update_record_stolen') and \
-            self._transaction.action == \
-                payload_pb2.InfinityPayload.UPDATE_RECORD_STOLEN:
-            return self._transaction.update_record_stolen
-
-
-        raise InvalidTransaction('Action does not match payload data')
+        if self._data is None:
+            raise InvalidTransaction('Action does not match payload data')
+        return self._data
 
     @property
     def timestamp(self):
-        return self._transaction.timestamp
+        return self._timestamp
 
     def __str__(self):
         return str(self.__class__) + '\n' + '\n'.join(
-            ('{} = {}'.format(item, self.__dict__[item]) for item in self.__dict__))
\ No newline at end of file
+            ('{} = {}'.format(item, getattr(self, item))
+             for item in self.__slots__))
@@ -1,10 +1,21 @@
+import hashlib
+
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+
 from infinity_addressing import addresser
+from infinity_addressing import layout
 
 from infinity_protobuf import user_pb2
 from infinity_protobuf import record_pb2
 
 
-
+CONTAINERS = {
+    addresser.AddressSpace.USER: user_pb2.UserContainer,
+    addresser.AddressSpace.RECORD: record_pb2.RecordContainer,
+    addresser.AddressSpace.RECORD_STATUS: record_pb2.RecordStatusContainer,
+    addresser.AddressSpace.RECORD_LOCATIONS:
+        record_pb2.RecordLocationsContainer
+}
 
 
 def set_role(role):
@@ -22,9 +33,75 @@ def set_role(role):
 
 
 class InfinityState(object):
-    def __init__(self, context, timeout=2):
+    def __init__(self,
+                 context,
+                 timeout=2,
+                 max_locations=0,
+                 state_layout=layout.CONTAINER,
+                 split_record_state=False):
+        """
+        Args:
+            context (sawtooth_sdk.processor.context.Context): Access to
+                validator state from within the transaction processor
+            timeout (int): Seconds to wait for get_state/set_state
+            max_locations (int): Number of most recent locations kept on
+                each record. Older ones are folded into the record's
+                evicted_locations_digest. 0 keeps the full history
+            state_layout (str): Layout written to state, one of
+                infinity_addressing.layout.STATE_LAYOUTS. Both layouts
+                are always readable
+            split_record_state (bool): Whether new records keep their
+                status and locations at separate addresses, see
+                record_pb2.Record.split_state
+        """
         self._context = context
         self._timeout = timeout
+        self._max_locations = max_locations
+        self._state_layout = state_layout
+        self._split_record_state = split_record_state
+        self._address_cache = {}
+        self._pending_addresses = {}
+        self._state_reads = 0
+
+    @property
+    def state_reads(self):
+        """int: Number of get_state round trips made to the validator"""
+        return self._state_reads
+
+    def prefetch(self, addresses):
+        """Reads every given address that is not cached yet with a single
+        get_state call, so later reads within the transaction are served
+        from the cache
+
+        Args:
+            addresses (list of str): The state addresses to read
+        """
+        addresses = [address for address in dict.fromkeys(addresses)
+                     if address not in self._address_cache]
+        if not addresses:
+            return
+
+        state_entries = self._context.get_state(
+            addresses=addresses, timeout=self._timeout)
+        self._state_reads += 1
+        for address in addresses:
+            self._address_cache[address] = _new_container(address)
+        for entry in state_entries:
+            _parse_container(self._address_cache[entry.address], entry.data)
+
+    def flush(self):
+        """Writes every container modified during the transaction back to
+        state with a single set_state call
+        """
+        if not self._pending_addresses:
+            return
+
+        updated_state = {}
+        for address in self._pending_addresses:
+            updated_state[address] = self._serialize_container(
+                self._address_cache[address])
+        self._pending_addresses = {}
+        self._context.set_state(updated_state, timeout=self._timeout)
 
     def get_user(self, public_key):
         """Gets the user associated with the public_key
@@ -36,14 +113,10 @@ class InfinityState(object):
             user_pb2.User: User with the provided public_key
         """
         address = addresser.get_user_address(public_key)
-        state_entries = self._context.get_state(
-            addresses=[address], timeout=self._timeout)
-        if state_entries:
-            container = user_pb2.UserContainer()
-            container.ParseFromString(state_entries[0].data)
-            for user in container.entries:
-                if user.public_key == public_key:
-                    return user
+        container = self._get_container(address)
+        for user in container.entries:
+            if user.public_key == public_key:
+                return user
 
         return None
 
@@ -60,18 +133,7 @@ class InfinityState(object):
 
         user = user_pb2.User(
             public_key=public_key, name=name, timestamp=timestamp, role=role)
-        container = user_pb2.UserContainer()
-        state_entries = self._context.get_state(
-            addresses=[address], timeout=self._timeout)
-        if state_entries:
-            container.ParseFromString(state_entries[0].data)
-
-        container.entries.extend([user])
-        data = container.SerializeToString()
-
-        updated_state = {}
-        updated_state[address] = data
-        self._context.set_state(updated_state, timeout=self._timeout)
+        self._add_entry(address, user)
 
     def get_record(self, record_id):
         """Gets the record associated with the record_id
@@ -83,14 +145,48 @@ class InfinityState(object):
             record_pb2.Record: Record with the provided record_id
         """
         address = addresser.get_record_address(record_id)
-        state_entries = self._context.get_state(
-            addresses=[address], timeout=self._timeout)
-        if state_entries:
-            container = record_pb2.RecordContainer()
-            container.ParseFromString(state_entries[0].data)
-            for record in container.entries:
-                if record.record_id == record_id:
-                    return record
+        container = self._get_container(address)
+        for record in container.entries:
+            if record.record_id == record_id:
+                if not record.current_owner and record.owners:
+                    _migrate_current_owner(record)
+                return record
+
+        return None
+
+    def get_record_status(self, record_id):
+        """Gets the split out status of the record associated with the
+        record_id
+
+        Args:
+            record_id (str): The id of the record
+
+        Returns:
+            record_pb2.RecordStatus: Status of the record, None if the
+                record does not have split state
+        """
+        address = addresser.get_record_status_address(record_id)
+        for status in self._get_container(address).entries:
+            if status.record_id == record_id:
+                return status
+
+        return None
+
+    def get_record_locations(self, record_id):
+        """Gets the split out locations of the record associated with the
+        record_id
+
+        Args:
+            record_id (str): The id of the record
+
+        Returns:
+            record_pb2.RecordLocations: Locations of the record, None if
+                the record does not have split state
+        """
+        address = addresser.get_record_locations_address(record_id)
+        for locations in self._get_container(address).entries:
+            if locations.record_id == record_id:
+                return locations
 
         return None
 
@@ -135,89 +231,154 @@ class InfinityState(object):
             price=price,
             isForSale= isForSale,
             owners=[owner],
+            current_owner=public_key,
             creator=creator,
             locations=[location],
             created_timestamp=timestamp,
             )
-        container = record_pb2.RecordContainer()
-        state_entries = self._context.get_state(
-            addresses=[address], timeout=self._timeout)
-        if state_entries:
-            container.ParseFromString(state_entries[0].data)
+        if self._split_record_state:
+            del record.locations[:]
+            record.split_state = True
+            self._add_entry(
+                addresser.get_record_status_address(record_id),
+                record_pb2.RecordStatus(
+                    record_id=record_id, isForSale=isForSale))
+            self._add_entry(
+                addresser.get_record_locations_address(record_id),
+                record_pb2.RecordLocations(
+                    record_id=record_id, locations=[location]))
 
-        container.entries.extend([record])
-        data = container.SerializeToString()
-
-        updated_state = {}
-        updated_state[address] = data
-        self._context.set_state(updated_state, timeout=self._timeout)
+        self._add_entry(address, record)
 
     def transfer_record(self, receiving_user, record_id, timestamp):
         owner = record_pb2.Record.Owner(
             user_id=receiving_user,
             timestamp=timestamp)
         address = addresser.get_record_address(record_id)
-        container = record_pb2.RecordContainer()
-        state_entries = self._context.get_state(
-            addresses=[address], timeout=self._timeout)
-        if state_entries:
-            container.ParseFromString(state_entries[0].data)
-            for record in container.entries:
-                if record.record_id == record_id:
-                    record.owners.extend([owner])
-        data = container.SerializeToString()
-        updated_state = {}
-        updated_state[address] = data
-        self._context.set_state(updated_state, timeout=self._timeout)
+        record = self.get_record(record_id)
+        if record is not None:
+            record.owners.extend([owner])
+            record.current_owner = receiving_user
+        self._set_container(address, self._address_cache[address])
 
     def update_record_location(self, latitude, longitude, record_id, timestamp):
         location = record_pb2.Record.Location(
             latitude=latitude,
             longitude=longitude,
             timestamp=timestamp)
-        address = addresser.get_record_address(record_id)
-        container = record_pb2.RecordContainer()
-        state_entries = self._context.get_state(
-            addresses=[address], timeout=self._timeout)
-        if state_entries:
-            container.ParseFromString(state_entries[0].data)
-            for record in container.entries:
-                if record.record_id == record_id:
-                    record.locations.extend([location])
-        data = container.SerializeToString()
-        updated_state = {}
-        updated_state[address] = data
-        self._context.set_state(updated_state, timeout=self._timeout)
-
+        record = self.get_record(record_id)
+        if record is not None and record.split_state:
+            address = addresser.get_record_locations_address(record_id)
+            entry = self.get_record_locations(record_id)
+        else:
+            address = addresser.get_record_address(record_id)
+            entry = record
+        if entry is not None:
+            entry.locations.extend([location])
+            self._evict_locations(entry)
+        self._set_container(address, self._address_cache[address])
 
     def update_record_is_for_sale(self, record_id, isForSale, timestamp):
-        address = addresser.get_record_address(record_id)
-        container = record_pb2.RecordContainer()
-        state_entries = self._context.get_state(
-            addresses=[address], timeout=self._timeout)
-        if state_entries:
-            container.ParseFromString(state_entries[0].data)
-            for record in container.entries:
-                if record.record_id == record_id:
-                    record.isForSale = isForSale
-                    record.updated_timestamp = timestamp
-            data = container.SerializeToString()
-            updated_state = {}
-            updated_state[address] = data
-            self._context.set_state(updated_state, timeout=self._timeout)
+        address, record = self._get_record_status_entry(record_id)
+        if record is not None:
+            record.isForSale = isForSale
+            record.updated_timestamp = timestamp
+            self._set_container(address, self._address_cache[address])
 
     def update_record_is_stolen(self, record_id, is_stolen, timestamp):
-        address = addresser.get_record_address(record_id)
-        container = record_pb2.RecordContainer()
-        state_entries = self._context.get_state(
-            addresses=[address], timeout=self._timeout)
-        if state_entries:
-            container.ParseFromString(state_entries[0].data)
-            for record in container.entries:
-                if record.record_id == record_id:
-                    record.is_stolen = is_stolen
-                    record.updated_timestamp = timestamp
-            data = container.SerializeToString()
-            updated_state = {}
-            updated_state[address] = data
-            self._context.set_state(updated_state, timeout=self._timeout)
\ No newline at end of file
+        address, record = self._get_record_status_entry(record_id)
+        if record is not None:
+            record.is_stolen = is_stolen
+            record.updated_timestamp = timestamp
+            self._set_container(address, self._address_cache[address])
+
+    def _get_record_status_entry(self, record_id):
+        """Returns the address and message holding the status fields of the
+        record: its RecordStatus if it has split state, else the Record
+        """
+        record = self.get_record(record_id)
+        if record is not None and record.split_state:
+            return (addresser.get_record_status_address(record_id),
+                    self.get_record_status(record_id))
+        return addresser.get_record_address(record_id), record
+
+    def _evict_locations(self, record):
+        """Drops the oldest locations of record beyond max_locations,
+        chaining each one into the record's evicted_locations_digest.
+        record is either a Record or a RecordLocations
+        """
+        excess = len(record.locations) - self._max_locations
+        if self._max_locations <= 0 or excess <= 0:
+            return
+
+        digest = record.evicted_locations_digest
+        for location in record.locations[:excess]:
+            digest = hashlib.sha512(
+                digest + location.SerializeToString()).digest()
+        del record.locations[:excess]
+
+        record.evicted_locations_digest = digest
+        record.evicted_location_count += excess
+
+    def _get_container(self, address):
+        """Returns the parsed container stored at address. State is only
+        read from the validator the first time an address is requested;
+        later calls within the same transaction reuse the parsed container.
+        """
+        if address not in self._address_cache:
+            container = _new_container(address)
+            state_entries = self._context.get_state(
+                addresses=[address], timeout=self._timeout)
+            self._state_reads += 1
+            if state_entries:
+                _parse_container(container, state_entries[0].data)
+            self._address_cache[address] = container
+
+        return self._address_cache[address]
+
+    def _add_entry(self, address, entry):
+        container = self._get_container(address)
+        self._check_collision(address, container)
+
+        container.entries.extend([entry])
+        self._set_container(address, container)
+
+    def _set_container(self, address, container):
+        """Stages container to be written to address on the next flush"""
+        self._address_cache[address] = container
+        self._pending_addresses[address] = True
+
+    def _check_collision(self, address, container):
+        """Rejects a new entry at an address that is already taken by a
+        different key, since the single entry layout holds only one
+        """
+        if self._state_layout == layout.SINGLE_ENTRY and container.entries:
+            raise InvalidTransaction(
+                'Address {} is already used by another entry'.format(address))
+
+    def _serialize_container(self, container):
+        if self._state_layout == layout.SINGLE_ENTRY and \
+                len(container.entries) == 1:
+            return layout.SINGLE_ENTRY_MARKER + \
+                container.entries[0].SerializeToString()
+        return container.SerializeToString()
+
+
+def _new_container(address):
+    return CONTAINERS[addresser.get_address_type(address)]()
+
+
+def _parse_container(container, data):
+    """Parses state data in either layout into container"""
+    if layout.is_single_entry(data):
+        container.entries.add().ParseFromString(data[1:])
+    else:
+        container.ParseFromString(data)
+
+
+def _migrate_current_owner(record):
+    """Fills in current_owner for records written before the field
+    existed. The value is persisted with the record's next write.
+    """
+    record.current_owner = max(
+        record.owners, key=lambda obj: obj.timestamp).user_id
@@ -1,28 +1,146 @@
 import asyncio
 import logging
+import time
 
 import aiopg
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+from infinity_rest_api.errors import ApiServiceUnavailable
+
 
 LATEST_BLOCK_NUM = """
 SELECT max(block_num) FROM blocks
 """
 LOGGER = logging.getLogger(__name__)
 
+# Channel the subscriber notifies whenever it changes the blocks table
+BLOCKS_CHANNEL = 'blocks'
+# Seconds to wait before listening again after losing the connection
+LISTEN_RETRY_DELAY = 5
+
+# Rows a streamed list reads from its server-side cursor at a time
+STREAM_BATCH_SIZE = 1000
+STREAM_CURSOR = 'stream_cursor'
+
+
+# Fields of the listed users and records, which the fields= projection of
+# a list request selects from, keyed by the name each is returned under
+USER_FIELDS = {
+    'public_key': 'public_key',
+    'name': 'name',
+    'role': 'role',
+    'timestamp': 'timestamp',
+}
+RECORD_FIELDS = {
+    'record_id': 'record_id',
+    'name': 'name',
+    'price': 'price',
+    'isforsale': 'isForSale',
+    'is_stolen': 'is_stolen',
+    'current_owner': 'current_owner',
+    'timestamp': 'timestamp',
+}
+
+# Fields of the listed records read from their own history tables
+RECORD_HISTORY_FIELDS = ('locations', 'owners')
+
+DEFAULT_USER_FIELDS = ('public_key', 'name', 'role', 'timestamp')
+DEFAULT_RECORD_FIELDS = (
+    'record_id', 'price', 'isforsale', 'is_stolen', 'locations', 'owners')
+
+# Conditions of the filters of a record list request, each reading its
+# value from the query parameter of the same name
+RECORD_FILTERS = {
+    'isForSale': 'isForSale = %(isForSale)s',
+    'is_stolen': 'is_stolen = %(is_stolen)s',
+    'owner': 'current_owner = %(owner)s',
+    'created_after': 'timestamp > %(created_after)s',
+    'created_before': 'timestamp < %(created_before)s',
+}
+
+FETCH_USER_QUERY = """
+SELECT public_key, name, role, timestamp FROM users
+WHERE public_key = %(public_key)s
+AND %(block_num)s >= start_block_num
+AND %(block_num)s < end_block_num;
+"""
+FETCH_RECORD_QUERY = """
+SELECT record_id, name, price, isForSale, is_stolen FROM records
+WHERE record_id = %(record_id)s
+AND %(block_num)s >= start_block_num
+AND %(block_num)s < end_block_num;
+"""
+
+# Histories are returned oldest first. A record's rows span the blocks
+# that appended them, so only the ORDER BY makes that order hold
+RECORD_HISTORY_QUERIES = {
+    'locations': """
+    SELECT record_id, latitude, longitude, timestamp FROM record_locations
+    WHERE record_id = ANY(%(record_ids)s)
+    AND %(block_num)s >= start_block_num
+    AND %(block_num)s < end_block_num
+    ORDER BY record_id, location_index, id;
+    """,
+    'owners': """
+    SELECT record_id, user_id, timestamp FROM record_owners
+    WHERE record_id = ANY(%(record_ids)s)
+    AND %(block_num)s >= start_block_num
+    AND %(block_num)s < end_block_num
+    ORDER BY record_id, timestamp, id;
+    """,
+}
+
 
 class Database(object):
-    """Manages connection to the postgres database and makes async queries
+    """Manages a pool of connections to the postgres database and makes
+    async queries
     """
-    def __init__(self, host, port, name, user, password, loop):
+    def __init__(self,
+                 host,
+                 port,
+                 name,
+                 user,
+                 password,
+                 loop,
+                 min_size=1,
+                 max_size=10,
+                 acquire_timeout=10,
+                 echo=False,
+                 metrics=None,
+                 block_cache_ttl=5):
+        """
+        Args:
+            min_size (int): Connections the pool opens up front and keeps
+            max_size (int): Connections the pool opens at most, which
+                bounds the number of concurrent queries
+            acquire_timeout (float): Seconds a query waits for a free
+                connection before the request fails
+            echo (bool): Whether to log every query
+            metrics (DatabaseMetrics): Collector of the pool metrics, if
+                any
+            block_cache_ttl (float): Seconds the latest block number is
+                cached for. The subscriber's notifications of new blocks
+                refresh it sooner
+        """
         self._dsn = 'dbname={} user={} password={} host={} port={}'.format(
             name, user, password, host, port)
         self._loop = loop
-        self._conn = None
+        self._min_size = min_size
+        self._max_size = max_size
+        self._acquire_timeout = acquire_timeout
+        self._echo = echo
+        self._metrics = metrics
+        self._pool = None
+
+        self._block_cache_ttl = block_cache_ttl
+        self._latest_block_num = None
+        self._latest_block_num_expiry = 0
+        self._block_notifications = 0
+        self._listener = None
 
     async def connect(self, retries=5, initial_delay=1, backoff=2):
-        """Initializes a connection to the database
+        """Initializes the pool of connections to the database
 
         Args:
             retries (int): Number of times to retry the connection
@@ -34,9 +152,9 @@ class Database(object):
         delay = initial_delay
         for attempt in range(retries):
             try:
-                self._conn = await aiopg.connect(
-                    dsn=self._dsn, loop=self._loop, echo=True)
+                await self._create_pool()
                 LOGGER.info('Successfully connected to database')
+                self._start_listener()
                 return
 
             except psycopg2.OperationalError:
@@ -47,14 +165,80 @@ class Database(object):
                 await asyncio.sleep(delay)
                 delay *= backoff
 
-        self._conn = await aiopg.connect(
-            dsn=self._dsn, loop=self._loop, echo=True)
+        await self._create_pool()
         LOGGER.info('Successfully connected to database')
+        self._start_listener()
 
     def disconnect(self):
-        """Closes connection to the database
+        """Closes the connections to the database
+        """
+        if self._listener is not None:
+            self._listener.cancel()
+        if self._pool is not None:
+            self._pool.close()
+
+    async def _create_pool(self):
+        self._pool = await aiopg.create_pool(
+            dsn=self._dsn,
+            minsize=self._min_size,
+            maxsize=self._max_size,
+            loop=self._loop,
+            echo=self._echo)
+        if self._metrics is not None:
+            self._metrics.watch_pool(self._pool)
+
+    def _acquire(self):
+        return _PooledConnection(
+            self._pool, self._acquire_timeout, self._metrics)
+
+    def _start_listener(self):
+        self._listener = self._loop.create_task(self._listen_for_blocks())
+
+    async def _listen_for_blocks(self):
+        """Expires the cached latest block number whenever the subscriber
+        notifies of a change to the blocks table, listening again after
+        losing the connection
         """
-        self._conn.close()
+        while True:
+            try:
+                async with aiopg.connect(dsn=self._dsn) as conn:
+                    async with conn.cursor() as cursor:
+                        await cursor.execute(
+                            'LISTEN {}'.format(BLOCKS_CHANNEL))
+                    LOGGER.debug('Listening for block notifications')
+
+                    # Blocks may have changed while nobody was listening
+                    self._expire_latest_block_num()
+                    while True:
+                        await conn.notifies.get()
+                        self._expire_latest_block_num()
+
+            except psycopg2.Error:
+                LOGGER.warning(
+                    'Lost the connection listening for blocks,'
+                    ' listening again in %s seconds', LISTEN_RETRY_DELAY)
+                await asyncio.sleep(LISTEN_RETRY_DELAY)
+
+    def _expire_latest_block_num(self):
+        self._latest_block_num_expiry = 0
+        self._block_notifications += 1
+
+    async def _get_latest_block_num(self, conn):
+        """Returns the latest block number, reading it with conn once the
+        cached one has expired
+        """
+        if time.monotonic() < self._latest_block_num_expiry:
+            return self._latest_block_num
+
+        notifications = self._block_notifications
+        expiry = time.monotonic() + self._block_cache_ttl
+        block_num = await _fetch_latest_block_num(conn)
+
+        # A block notified of during the read may be missing from it
+        if notifications == self._block_notifications:
+            self._latest_block_num = block_num
+            self._latest_block_num_expiry = expiry
+        return block_num
 
     async def create_auth_entry(self,
                                 public_key,
@@ -75,115 +259,287 @@ class Database(object):
             hashed_password.hex(),
             role)
 
-        async with self._conn.cursor() as cursor:
-            await cursor.execute(insert)
-
-        self._conn.commit()
+        async with self._acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(insert)
 
     async def fetch_user_resource(self, public_key):
-        fetch = """
-        SELECT public_key, name, role, timestamp FROM users
-        WHERE public_key='{0}'
-        AND ({1}) >= start_block_num
-        AND ({1}) < end_block_num;
-        """.format(public_key, LATEST_BLOCK_NUM)
+        async with self._acquire() as conn:
+            block_num = await self._get_latest_block_num(conn)
+            async with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                await cursor.execute(
+                    FETCH_USER_QUERY,
+                    {'public_key': public_key, 'block_num': block_num})
+                return await cursor.fetchone()
+
+    async def list_user_resources(self,
+                                  limit=None,
+                                  after=None,
+                                  fields=DEFAULT_USER_FIELDS):
+        """Returns a page of the current users, ordered by public key, and
+        the public key to list the next page after, if there may be one
 
-        async with self._conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            await cursor.execute(fetch)
-            return await cursor.fetchone()
+        Args:
+            limit (int): Most users to return, or None for all of them
+            after (str): Public key the page starts after
+            fields (tuple of str): USER_FIELDS to return
+        """
+        async with self._acquire() as conn:
+            block_num = await self._get_latest_block_num(conn)
+            fetch, params = _build_list_query(
+                'users', 'public_key', USER_FIELDS, fields,
+                block_num, limit, after)
+
+            async with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                await cursor.execute(fetch, params)
+                users = await cursor.fetchall()
+
+        return _finish_page(users, 'public_key', fields, limit)
+
+    async def stream_user_resources(self,
+                                    write,
+                                    after=None,
+                                    fields=DEFAULT_USER_FIELDS):
+        """Reads the current users, ordered by public key, through a
+        server-side cursor and awaits write with every batch of them, so
+        only one batch is held in memory at a time
 
-    async def fetch_all_user_resources(self):
-        fetch = """
-        SELECT public_key, name, role , timestamp FROM users
-        WHERE ({0}) >= start_block_num
-        AND ({0}) < end_block_num;
-        """.format(LATEST_BLOCK_NUM)
+        Args:
+            write (coroutine function): Called with each list of users
+            after (str): Public key the users start after
+            fields (tuple of str): USER_FIELDS to return
+        """
+        async def write_users(users):
+            _strip_key(users, 'public_key', fields)
+            await write(users)
 
-        async with self._conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            await cursor.execute(fetch)
-            return await cursor.fetchall()
+        async with self._acquire() as conn:
+            block_num = await self._get_latest_block_num(conn)
+            fetch, params = _build_list_query(
+                'users', 'public_key', USER_FIELDS, fields,
+                block_num, None, after)
+            await _stream_query(conn, fetch, params, write_users)
 
     async def fetch_auth_resource(self, public_key):
         fetch = """
         SELECT * FROM auth WHERE public_key='{}'
         """.format(public_key)
 
-        async with self._conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            await cursor.execute(fetch)
-            return await cursor.fetchone()
+        async with self._acquire() as conn:
+            async with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                await cursor.execute(fetch)
+                return await cursor.fetchone()
 
     async def fetch_record_resource(self, record_id):
-        fetch_record = """
-        SELECT record_id, name, price, isForSale, is_stolen FROM records
-        WHERE record_id='{0}'
-        AND ({1}) >= start_block_num
-        AND ({1}) < end_block_num;
-        """.format(record_id, LATEST_BLOCK_NUM)
-
-        fetch_record_locations = """
-        SELECT latitude, longitude, timestamp FROM record_locations
-        WHERE record_id='{0}'
-        AND ({1}) >= start_block_num
-        AND ({1}) < end_block_num;
-        """.format(record_id, LATEST_BLOCK_NUM)
-
-        fetch_record_owners = """
-        SELECT user_id, timestamp FROM record_owners
-        WHERE record_id='{0}'
-        AND ({1}) >= start_block_num
-        AND ({1}) < end_block_num;
-        """.format(record_id, LATEST_BLOCK_NUM)
-
-        async with self._conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            try:
-                await cursor.execute(fetch_record)
+        async with self._acquire() as conn:
+            block_num = await self._get_latest_block_num(conn)
+            async with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                await cursor.execute(
+                    FETCH_RECORD_QUERY,
+                    {'record_id': record_id, 'block_num': block_num})
                 record = await cursor.fetchone()
+                if record is None:
+                    return None
 
-                await cursor.execute(fetch_record_locations)
-                record['locations'] = await cursor.fetchall()
-
-                await cursor.execute(fetch_record_owners)
-                record['owners'] = await cursor.fetchall()
-
+                await _fetch_record_histories(cursor, [record], block_num)
                 return record
-            except TypeError:
-                return None
 
-    async def fetch_all_record_resources(self):
-        fetch_records = """
-        SELECT record_id, price, isForSale , is_stolen From records
-        WHERE ({0}) >= start_block_num
-        AND ({0}) < end_block_num;
-        """.format(LATEST_BLOCK_NUM)
+    async def list_record_resources(self,
+                                    limit=None,
+                                    after=None,
+                                    fields=DEFAULT_RECORD_FIELDS,
+                                    filters=None):
+        """Returns a page of the current records, ordered by record id, and
+        the record id to list the next page after, if there may be one
 
-        async with self._conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            try:
-                await cursor.execute(fetch_records)
+        Args:
+            limit (int): Most records to return, or None for all of them
+            after (str): Record id the page starts after
+            fields (tuple of str): RECORD_FIELDS and RECORD_HISTORY_FIELDS
+                to return. Histories not asked for are not queried
+            filters (dict): Values of the RECORD_FILTERS to apply
+        """
+        async with self._acquire() as conn:
+            block_num = await self._get_latest_block_num(conn)
+            fetch, params = _build_list_query(
+                'records', 'record_id', RECORD_FIELDS, fields,
+                block_num, limit, after, RECORD_FILTERS, filters)
+
+            async with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                await cursor.execute(fetch, params)
                 records = await cursor.fetchall()
 
-                for record in records:
-                    fetch_record_locations = """
-                    SELECT latitude, longitude, timestamp
-                    FROM record_locations
-                    WHERE record_id='{0}'
-                    AND ({1}) >= start_block_num
-                    AND ({1}) < end_block_num;
-                    """.format(record['record_id'], LATEST_BLOCK_NUM)
-
-                    fetch_record_owners = """
-                    SELECT user_id, timestamp
-                    FROM record_owners
-                    WHERE record_id='{0}'
-                    AND ({1}) >= start_block_num
-                    AND ({1}) < end_block_num;
-                    """.format(record['record_id'], LATEST_BLOCK_NUM)
-
-                    await cursor.execute(fetch_record_locations)
-                    record['locations'] = await cursor.fetchall()
-
-                    await cursor.execute(fetch_record_owners)
-                    record['owners'] = await cursor.fetchall()
-
-                return records
-            except TypeError:
-                return []
+                await _fetch_record_histories(
+                    cursor, records, block_num,
+                    [field for field in RECORD_HISTORY_FIELDS
+                     if field in fields])
+
+        return _finish_page(records, 'record_id', fields, limit)
+
+    async def stream_record_resources(self,
+                                      write,
+                                      after=None,
+                                      fields=DEFAULT_RECORD_FIELDS,
+                                      filters=None):
+        """Reads the current records, ordered by record id, through a
+        server-side cursor and awaits write with every batch of them, so
+        only one batch is held in memory at a time
+
+        Args:
+            write (coroutine function): Called with each list of records
+            after (str): Record id the records start after
+            fields (tuple of str): RECORD_FIELDS and RECORD_HISTORY_FIELDS
+                to return
+            filters (dict): Values of the RECORD_FILTERS to apply
+        """
+        histories = [field for field in RECORD_HISTORY_FIELDS
+                     if field in fields]
+
+        async with self._acquire() as conn:
+            block_num = await self._get_latest_block_num(conn)
+            fetch, params = _build_list_query(
+                'records', 'record_id', RECORD_FIELDS, fields,
+                block_num, None, after, RECORD_FILTERS, filters)
+
+            async def write_records(records):
+                async with conn.cursor(
+                        cursor_factory=RealDictCursor) as cursor:
+                    await _fetch_record_histories(
+                        cursor, records, block_num, histories)
+                _strip_key(records, 'record_id', fields)
+                await write(records)
+
+            await _stream_query(conn, fetch, params, write_records)
+
+
+async def _fetch_latest_block_num(conn):
+    """Returns the number of the latest block, which every query of a
+    request reads its resources at
+    """
+    async with conn.cursor() as cursor:
+        await cursor.execute(LATEST_BLOCK_NUM)
+        return (await cursor.fetchone())[0]
+
+
+async def _fetch_record_histories(cursor,
+                                  records,
+                                  block_num,
+                                  histories=RECORD_HISTORY_FIELDS):
+    """Sets the given histories of each of records, as of block_num, with
+    one query per history table
+    """
+    records_by_id = {record['record_id']: record for record in records}
+    for record in records:
+        for history in histories:
+            record[history] = []
+    if not records_by_id:
+        return
+
+    params = {'record_ids': list(records_by_id), 'block_num': block_num}
+    for history in histories:
+        await cursor.execute(RECORD_HISTORY_QUERIES[history], params)
+        for row in await cursor.fetchall():
+            records_by_id[row.pop('record_id')][history].append(row)
+
+
+def _build_list_query(table,
+                      key,
+                      columns,
+                      fields,
+                      block_num,
+                      limit,
+                      after,
+                      conditions=None,
+                      filters=None):
+    """Returns the query, and its parameters, of a page of the versions of
+    table current at block_num, in key order. The key column is always
+    selected, to page on
+    """
+    selected = [key] + [
+        columns[field] for field in fields if field in columns
+        and field != key]
+    where = ['%(block_num)s >= start_block_num',
+             '%(block_num)s < end_block_num']
+    params = {'block_num': block_num, 'after': after, 'limit': limit}
+
+    if after is not None:
+        where.append('{} > %(after)s'.format(key))
+    for name, value in (filters or {}).items():
+        where.append(conditions[name])
+        params[name] = value
+
+    query = 'SELECT {} FROM {} WHERE {} ORDER BY {}'.format(
+        ', '.join(selected), table, ' AND '.join(where), key)
+    if limit is not None:
+        query += ' LIMIT %(limit)s'
+    return query, params
+
+
+def _finish_page(rows, key, fields, limit):
+    """Returns rows without the key unless it was asked for, and the key
+    of the last row if the page is full
+    """
+    after = None
+    if limit is not None and rows and len(rows) == limit:
+        after = rows[-1][key]
+    _strip_key(rows, key, fields)
+    return rows, after
+
+
+def _strip_key(rows, key, fields):
+    if key not in fields:
+        for row in rows:
+            del row[key]
+
+
+async def _stream_query(conn, query, params, write_rows):
+    """Declares a server-side cursor over query, in a transaction of its
+    own, and awaits write_rows with every STREAM_BATCH_SIZE rows fetched
+    from it
+    """
+    async with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        await cursor.execute('BEGIN')
+        try:
+            await cursor.execute(
+                'DECLARE {} NO SCROLL CURSOR FOR {}'.format(
+                    STREAM_CURSOR, query),
+                params)
+            while True:
+                await cursor.execute(
+                    'FETCH %s FROM {}'.format(STREAM_CURSOR),
+                    (STREAM_BATCH_SIZE,))
+                rows = await cursor.fetchall()
+                if not rows:
+                    break
+                await write_rows(rows)
+        finally:
+            await cursor.execute('ROLLBACK')
+
+
+class _PooledConnection(object):
+    """Async context manager which acquires a connection from the pool,
+    waiting at most acquire_timeout seconds, and releases it on exit
+    """
+    def __init__(self, pool, acquire_timeout, metrics):
+        self._pool = pool
+        self._acquire_timeout = acquire_timeout
+        self._metrics = metrics
+        self._conn = None
+
+    async def __aenter__(self):
+        start = time.perf_counter()
+        try:
+            self._conn = await asyncio.wait_for(
+                self._pool.acquire(), self._acquire_timeout)
+        except asyncio.TimeoutError:
+            if self._metrics is not None:
+                self._metrics.observe_acquire_timeout()
+            raise ApiServiceUnavailable(
+                'No database connection available, try again later')
+
+        if self._metrics is not None:
+            self._metrics.observe_acquire(time.perf_counter() - start)
+        return self._conn
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        self._pool.release(self._conn)
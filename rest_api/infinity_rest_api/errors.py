@@ -54,6 +54,13 @@ class ApiNotFound(_ApiError):
         super().__init__()
 
 
+class ApiServiceUnavailable(_ApiError):
+    def __init__(self, message):
+        self.status_code = 503
+        self.message = 'Service Unavailable: ' + message
+        super().__init__()
+
+
 class ApiUnauthorized(_ApiError):
     def __init__(self, message):
         self.status_code = 401
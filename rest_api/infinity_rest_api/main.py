@@ -53,6 +53,39 @@ def parse_args(args):
         '--db-password',
         help="The authorized user's password for database access",
         default='sawtooth')
+    parser.add_argument(
+        '--db-pool-min',
+        help='Database connections opened up front',
+        type=int,
+        default=1)
+    parser.add_argument(
+        '--db-pool-max',
+        help='Database connections opened at most, which bounds the '
+             'number of concurrent queries',
+        type=int,
+        default=10)
+    parser.add_argument(
+        '--db-acquire-timeout',
+        help='Seconds a request waits for a free database connection '
+             'before failing with 503',
+        type=float,
+        default=10)
+    parser.add_argument(
+        '--block-cache-ttl',
+        help='Seconds the latest block number is cached for when no '
+             'notification of a new block arrives from the subscriber',
+        type=float,
+        default=5)
+    parser.add_argument(
+        '--db-echo',
+        help='Log every database query',
+        action='store_true')
+    parser.add_argument(
+        '--metrics-port',
+        help='Serve Prometheus metrics on this port. Requires the '
+             'prometheus_client package',
+        type=int,
+        default=None)
     parser.add_argument(
         '-v', '--verbose',
         action='count',
@@ -83,6 +116,10 @@ def start_rest_api(host, port, messenger, database):
     app.router.add_get('/users/{user_id}', handler.fetch_user)
 
     app.router.add_post('/records', handler.create_record)
+    app.router.add_post('/records_batch', handler.batch_create_records)
+    app.router.add_post(
+        '/records_batch/update_location',
+        handler.batch_update_record_locations)
     app.router.add_get('/records', handler.list_records)
     app.router.add_get('/records/{record_id}', handler.fetch_record)
     app.router.add_post(
@@ -114,13 +151,25 @@ def main():
             validator_url = "tcp://" + validator_url
         messenger = Messenger(validator_url)
 
+        metrics = None
+        if opts.metrics_port is not None:
+            from infinity_rest_api.metrics import DatabaseMetrics
+            metrics = DatabaseMetrics()
+            metrics.start_server(opts.metrics_port)
+
         database = Database(
             opts.db_host,
             opts.db_port,
             opts.db_name,
             opts.db_user,
             opts.db_password,
-            loop)
+            loop,
+            min_size=opts.db_pool_min,
+            max_size=opts.db_pool_max,
+            acquire_timeout=opts.db_acquire_timeout,
+            echo=opts.db_echo,
+            metrics=metrics,
+            block_cache_ttl=opts.block_cache_ttl)
 
         try:
             host, port = opts.bind.split(":")
@@ -18,6 +18,10 @@ from infinity_rest_api.transaction_creation import \
     make_update_record_location_transaction
 from infinity_rest_api.transaction_creation import \
     make_update_record_is_for_sale_transaction
+from infinity_rest_api.transaction_creation import \
+    make_batch_create_records_transaction
+from infinity_rest_api.transaction_creation import \
+    make_batch_update_record_locations_transaction
 
 
 class Messenger(object):
@@ -144,6 +148,30 @@ class Messenger(object):
             timestamp=timestamp)
         await self._send_and_wait_for_commit(batch)
 
+    async def send_batch_create_records_transaction(self,
+                                                    private_key,
+                                                    records,
+                                                    timestamp):
+        transaction_signer = self._crypto_factory.new_signer(
+            secp256k1.Secp256k1PrivateKey.from_hex(private_key))
+        batch = make_batch_create_records_transaction(
+            transaction_signer=transaction_signer,
+            batch_signer=self._batch_signer,
+            records=records,
+            timestamp=timestamp)
+        await self._send_and_wait_for_commit(batch)
+
+    async def send_batch_update_record_locations_transaction(
+            self, private_key, locations, timestamp):
+        transaction_signer = self._crypto_factory.new_signer(
+            secp256k1.Secp256k1PrivateKey.from_hex(private_key))
+        batch = make_batch_update_record_locations_transaction(
+            transaction_signer=transaction_signer,
+            batch_signer=self._batch_signer,
+            locations=locations,
+            timestamp=timestamp)
+        await self._send_and_wait_for_commit(batch)
+
     async def _send_and_wait_for_commit(self, batch):
         # Send transaction to validator
         submit_request = client_batch_submit_pb2.ClientBatchSubmitRequest(
@@ -0,0 +1,42 @@
+from prometheus_client import Counter
+from prometheus_client import Gauge
+from prometheus_client import Histogram
+from prometheus_client import start_http_server
+
+
+class DatabaseMetrics(object):
+    """Prometheus metrics of the REST API's database connection pool"""
+    def __init__(self, registry=None):
+        kwargs = {} if registry is None else {'registry': registry}
+
+        self._acquire_seconds = Histogram(
+            'infinity_rest_api_db_acquire_seconds',
+            'Time spent waiting for a pooled database connection',
+            **kwargs)
+        self._acquire_timeouts_total = Counter(
+            'infinity_rest_api_db_acquire_timeouts_total',
+            'Queries that gave up waiting for a pooled database connection',
+            **kwargs)
+        self._pool_connections = Gauge(
+            'infinity_rest_api_db_pool_connections',
+            'Connections opened by the database pool',
+            ['state'],
+            **kwargs)
+
+    def start_server(self, port):
+        """Serves the metrics over HTTP on the given port from a daemon
+        thread
+        """
+        start_http_server(port)
+
+    def watch_pool(self, pool):
+        """Reports the open and free connections of an aiopg pool"""
+        self._pool_connections.labels('open').set_function(lambda: pool.size)
+        self._pool_connections.labels('free').set_function(
+            lambda: pool.freesize)
+
+    def observe_acquire(self, elapsed):
+        self._acquire_seconds.observe(elapsed)
+
+    def observe_acquire_timeout(self):
+        self._acquire_timeouts_total.inc()
@@ -1,14 +1,21 @@
-import datetime
+import json
 from json.decoder import JSONDecodeError
 import logging
-import time
 
 from aiohttp.web import json_response
+from aiohttp.web import StreamResponse
 import bcrypt
 from Crypto.Cipher import AES
 from itsdangerous import BadSignature
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 
+from infinity_addressing import clock
+
+from infinity_rest_api.database import DEFAULT_RECORD_FIELDS
+from infinity_rest_api.database import DEFAULT_USER_FIELDS
+from infinity_rest_api.database import RECORD_FIELDS
+from infinity_rest_api.database import RECORD_HISTORY_FIELDS
+from infinity_rest_api.database import USER_FIELDS
 from infinity_rest_api.errors import ApiBadRequest
 from infinity_rest_api.errors import ApiNotFound
 from infinity_rest_api.errors import ApiUnauthorized
@@ -16,6 +23,17 @@ from infinity_rest_api.errors import ApiUnauthorized
 
 LOGGER = logging.getLogger(__name__)
 
+# Number of users or records a list request returns when it sets no limit,
+# and the most it may ask for
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
+BOOLEAN_VALUES = {'true': True, 'false': False}
+
+# Media type of list requests asking for every matching resource as a
+# stream of newline delimited JSON objects, instead of a page
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
 
 class RouteHandler(object):
     def __init__(self, loop, messenger, database):
@@ -69,9 +87,20 @@ class RouteHandler(object):
 
         return json_response({'authorization': token})
 
-    async def list_users(self, _request):
-        user_list = await self._database.fetch_all_user_resources()
-        return json_response(user_list)
+    async def list_users(self, request):
+        limit, after, fields = get_page_params(
+            request, USER_FIELDS, DEFAULT_USER_FIELDS)
+
+        if accepts_ndjson(request):
+            return await ndjson_response(
+                request,
+                self._database.stream_user_resources,
+                after=after,
+                fields=fields)
+
+        user_list, next_after = await self._database.list_user_resources(
+            limit=limit, after=after, fields=fields)
+        return page_response(request, user_list, next_after)
 
     async def fetch_user(self, request):
         public_key = request.match_info.get('user_id', '')
@@ -102,9 +131,42 @@ class RouteHandler(object):
         return json_response(
             {'data': 'Create record transaction submitted'})
 
-    async def list_records(self, _request):
-        record_list = await self._database.fetch_all_record_resources()
-        return json_response(record_list)
+    async def batch_create_records(self, request):
+        private_key = await self._authorize(request)
+
+        body = await decode_request(request)
+        validate_object_list('records', body)
+        required_fields = ['latitude', 'longitude', 'record_id', 'name',
+                           'price', 'isForSale']
+        for record in body['records']:
+            validate_fields(required_fields, record)
+
+        await self._messenger.send_batch_create_records_transaction(
+            private_key=private_key,
+            records=body['records'],
+            timestamp=get_time())
+
+        return json_response(
+            {'data': 'Batch create records transaction submitted'})
+
+    async def list_records(self, request):
+        limit, after, fields = get_page_params(
+            request,
+            tuple(RECORD_FIELDS) + RECORD_HISTORY_FIELDS,
+            DEFAULT_RECORD_FIELDS)
+        filters = get_record_filters(request)
+
+        if accepts_ndjson(request):
+            return await ndjson_response(
+                request,
+                self._database.stream_record_resources,
+                after=after,
+                fields=fields,
+                filters=filters)
+
+        record_list, next_after = await self._database.list_record_resources(
+            limit=limit, after=after, fields=fields, filters=filters)
+        return page_response(request, record_list, next_after)
 
     async def fetch_record(self, request):
         record_id = request.match_info.get('record_id', '')
@@ -151,6 +213,24 @@ class RouteHandler(object):
 
         return json_response(
             {'data': 'Update record transaction submitted'})
+
+    async def batch_update_record_locations(self, request):
+        private_key = await self._authorize(request)
+
+        body = await decode_request(request)
+        validate_object_list('locations', body)
+        required_fields = ['record_id', 'latitude', 'longitude']
+        for location in body['locations']:
+            validate_fields(required_fields, location)
+
+        await self._messenger.send_batch_update_record_locations_transaction(
+            private_key=private_key,
+            locations=body['locations'],
+            timestamp=get_time())
+
+        return json_response(
+            {'data': 'Batch update record transaction submitted'})
+
     async def update_record_for_sale(self, request):
         private_key = await self._authorize(request)
 
@@ -225,6 +305,113 @@ def validate_fields(required_fields, body):
                 "'{}' parameter is required".format(field))
 
 
+def validate_object_list(field, body):
+    items = body.get(field)
+    if not isinstance(items, list) or not items or \
+            not all(isinstance(item, dict) for item in items):
+        raise ApiBadRequest(
+            "'{}' parameter must be a non-empty list of objects".format(
+                field))
+
+
+def get_page_params(request, field_names, default_fields):
+    """Returns the limit, the key to start after and the fields of the page
+    a list request asks for with its limit, after and fields= parameters.
+    Requests with neither limit nor after are not paged, so the limit is
+    None and every resource is listed
+    """
+    after = request.query.get('after')
+    limit = get_query_param(request, 'limit', int)
+    if limit is None:
+        limit = None if after is None else DEFAULT_PAGE_LIMIT
+    elif not 0 < limit <= MAX_PAGE_LIMIT:
+        raise ApiBadRequest(
+            "'limit' parameter must be between 1 and {}".format(
+                MAX_PAGE_LIMIT))
+
+    fields = request.query.get('fields')
+    if fields is None:
+        return limit, after, default_fields
+
+    fields = tuple(field.strip().lower() for field in fields.split(','))
+    for field in fields:
+        if field not in field_names:
+            raise ApiBadRequest(
+                "'fields' parameter must be a list of {}".format(
+                    ', '.join(field_names)))
+    return limit, after, fields
+
+
+def get_record_filters(request):
+    """Returns the values of the record filters set by a list request
+    """
+    filters = {
+        'isForSale': get_query_param(request, 'isForSale', parse_boolean),
+        'is_stolen': get_query_param(request, 'is_stolen', parse_boolean),
+        'owner': request.query.get('owner'),
+        'created_after': get_query_param(request, 'created_after', int),
+        'created_before': get_query_param(request, 'created_before', int),
+    }
+    return {name: value for name, value in filters.items()
+            if value is not None}
+
+
+def get_query_param(request, name, convert):
+    value = request.query.get(name)
+    if value is None:
+        return None
+    try:
+        return convert(value)
+    except ValueError:
+        raise ApiBadRequest(
+            "'{}' parameter has an invalid value".format(name))
+
+
+def parse_boolean(value):
+    try:
+        return BOOLEAN_VALUES[value.lower()]
+    except KeyError:
+        raise ValueError('Not a boolean: {}'.format(value))
+
+
+def page_response(request, resources, next_after):
+    """Returns the response listing a page of resources, which links to
+    the next page if there may be one
+    """
+    headers = {}
+    if next_after is not None:
+        headers['Link'] = '<{}>; rel="next"'.format(
+            request.rel_url.update_query(after=next_after))
+    return json_response(resources, headers=headers)
+
+
+def accepts_ndjson(request):
+    return NDJSON_CONTENT_TYPE in request.headers.get('Accept', '')
+
+
+async def ndjson_response(request, stream, **kwargs):
+    """Returns a chunked response writing, as newline delimited JSON, each
+    batch of resources the stream method of the database passes it. The
+    response is only started with the first batch, so errors getting a
+    connection are still answered with their own status
+    """
+    response = StreamResponse(headers={'Content-Type': NDJSON_CONTENT_TYPE})
+    response.enable_chunked_encoding()
+
+    async def write(resources):
+        if not response.prepared:
+            await response.prepare(request)
+        await response.write(''.join(
+            json.dumps(resource) + '\n' for resource in resources
+        ).encode('utf-8'))
+
+    await stream(write, **kwargs)
+    if not response.prepared:
+        await response.prepare(request)
+    await response.write_eof()
+    return response
+
+
 def encrypt_private_key(aes_key, public_key, private_key):
     init_vector = bytes.fromhex(public_key[:32])
     cipher = AES.new(bytes.fromhex(aes_key), AES.MODE_CBC, init_vector)
@@ -243,8 +430,7 @@ def hash_password(password):
 
 
 def get_time():
-    dts = datetime.datetime.utcnow()
-    return round(time.mktime(dts.timetuple()) + dts.microsecond/1e6)
+    return clock.get_time()
 
 
 def generate_auth_token(secret_key, public_key):
@@ -78,13 +78,14 @@ def make_create_record_transaction(transaction_signer,
         :param name:
     """
 
+    record_addresses = _get_record_addresses([record_id])
+
     inputs = [
         addresser.get_user_address(
-            transaction_signer.get_public_key().as_hex()),
-        addresser.get_record_address(record_id)
-    ]
+            transaction_signer.get_public_key().as_hex())
+    ] + record_addresses
 
-    outputs = [addresser.get_record_address(record_id)]
+    outputs = record_addresses
 
     action = payload_pb2.CreateRecordAction(
         record_id=record_id,
@@ -175,10 +176,11 @@ def make_update_record_location_transaction(transaction_signer,
     user_address = addresser.get_user_address(
         transaction_signer.get_public_key().as_hex())
     record_address = addresser.get_record_address(record_id)
+    locations_address = addresser.get_record_locations_address(record_id)
 
-    inputs = [user_address, record_address]
+    inputs = [user_address, record_address, locations_address]
 
-    outputs = [record_address]
+    outputs = [record_address, locations_address]
 
     action = payload_pb2.UpdateRecordLocationAction(
         record_id=record_id,
@@ -219,10 +221,11 @@ def make_update_record_is_for_sale_transaction(transaction_signer,
     user_address = addresser.get_user_address(
         transaction_signer.get_public_key().as_hex())
     record_address = addresser.get_record_address(record_id)
+    status_address = addresser.get_record_status_address(record_id)
 
-    inputs = [user_address, record_address]
+    inputs = [user_address, record_address, status_address]
 
-    outputs = [record_address]
+    outputs = [record_address, status_address]
 
     action = payload_pb2.UpdateRecordForSaleAction(
         record_id=record_id,
@@ -262,10 +265,11 @@ def make_update_record_stolen(transaction_signer,
     user_address = addresser.get_user_address(
         transaction_signer.get_public_key().as_hex())
     record_address = addresser.get_record_address(record_id)
+    status_address = addresser.get_record_status_address(record_id)
 
-    inputs = [user_address, record_address]
+    inputs = [user_address, record_address, status_address]
 
-    outputs = [record_address]
+    outputs = [record_address, status_address]
 
     action = payload_pb2.UpdateRecordStolenAction(
         record_id=record_id,
@@ -285,6 +289,126 @@ def make_update_record_stolen(transaction_signer,
         batch_signer=batch_signer)
 
 
+def make_batch_create_records_transaction(transaction_signer,
+                                          batch_signer,
+                                          records,
+                                          timestamp):
+    """Make a BatchCreateRecordsAction transaction and wrap it in a batch
+
+    Args:
+        transaction_signer (sawtooth_signing.Signer): The transaction key pair
+        batch_signer (sawtooth_signing.Signer): The batch key pair
+        records (list of dict): The records to create, each with the
+            record_id, name, imageUrl, price, isForSale, latitude and
+            longitude of a CreateRecordAction
+        timestamp (int): Unix UTC timestamp of when the records are created
+
+    Returns:
+        batch_pb2.Batch: The transaction wrapped in a batch
+    """
+    record_addresses = _get_record_addresses(
+        [record['record_id'] for record in records])
+
+    inputs = [
+        addresser.get_user_address(
+            transaction_signer.get_public_key().as_hex())
+    ] + record_addresses
+
+    outputs = record_addresses
+
+    action = payload_pb2.BatchCreateRecordsAction(
+        records=[
+            payload_pb2.CreateRecordAction(
+                record_id=record['record_id'],
+                latitude=record['latitude'],
+                imageUrl=record.get('imageUrl'),
+                name=record['name'],
+                price=record['price'],
+                isForSale=record['isForSale'],
+                longitude=record['longitude'])
+            for record in records
+        ])
+
+    payload = payload_pb2.InfinityPayload(
+        action=payload_pb2.InfinityPayload.BATCH_CREATE_RECORDS,
+        batch_create_records=action,
+        timestamp=timestamp)
+    payload_bytes = payload.SerializeToString()
+
+    return _make_batch(
+        payload_bytes=payload_bytes,
+        inputs=inputs,
+        outputs=outputs,
+        transaction_signer=transaction_signer,
+        batch_signer=batch_signer)
+
+
+def make_batch_update_record_locations_transaction(transaction_signer,
+                                                   batch_signer,
+                                                   locations,
+                                                   timestamp):
+    """Make a BatchUpdateRecordLocationsAction transaction and wrap it in a
+    batch
+
+    Args:
+        transaction_signer (sawtooth_signing.Signer): The transaction key pair
+        batch_signer (sawtooth_signing.Signer): The batch key pair
+        locations (list of dict): The location fixes to apply, each with
+            the record_id, latitude and longitude of the update
+        timestamp (int): Unix UTC timestamp of when the records are updated
+
+    Returns:
+        batch_pb2.Batch: The transaction wrapped in a batch
+    """
+    user_address = addresser.get_user_address(
+        transaction_signer.get_public_key().as_hex())
+    record_ids = list(dict.fromkeys(
+        location['record_id'] for location in locations))
+    record_addresses = addresser.get_record_addresses(record_ids)
+    locations_addresses = [
+        addresser.get_record_locations_address(record_id)
+        for record_id in record_ids
+    ]
+
+    inputs = [user_address] + record_addresses + locations_addresses
+
+    outputs = record_addresses + locations_addresses
+
+    action = payload_pb2.BatchUpdateRecordLocationsAction(
+        updates=[
+            payload_pb2.UpdateRecordLocationAction(
+                record_id=location['record_id'],
+                latitude=location['latitude'],
+                longitude=location['longitude'])
+            for location in locations
+        ])
+
+    payload = payload_pb2.InfinityPayload(
+        action=payload_pb2.InfinityPayload.BATCH_UPDATE_RECORD_LOCATIONS,
+        batch_update_record_locations=action,
+        timestamp=timestamp)
+    payload_bytes = payload.SerializeToString()
+
+    return _make_batch(
+        payload_bytes=payload_bytes,
+        inputs=inputs,
+        outputs=outputs,
+        transaction_signer=transaction_signer,
+        batch_signer=batch_signer)
+
+
+def _get_record_addresses(record_ids):
+    """Returns the record, status and locations addresses of each record,
+    all of which are written when a record is created
+    """
+    return addresser.get_record_addresses(record_ids) + [
+        address
+        for record_id in record_ids
+        for address in (addresser.get_record_status_address(record_id),
+                        addresser.get_record_locations_address(record_id))
+    ]
+
+
 def _make_batch(payload_bytes,
                 inputs,
                 outputs,
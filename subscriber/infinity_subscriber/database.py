@@ -1,13 +1,25 @@
 
+import io
 import logging
+import math
 import time
 
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from psycopg2.extras import execute_values
 
 
+MAX_BLOCK_NUMBER = int(math.pow(2, 63)) - 1
 LOGGER = logging.getLogger(__name__)
 
+# Characters escaped in the text format of COPY FROM STDIN
+COPY_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+})
+
 
 CREATE_BLOCK_STMTS = """
 CREATE TABLE IF NOT EXISTS blocks (
@@ -35,12 +47,47 @@ CREATE TABLE IF NOT EXISTS records (
     price            varchar,
     isForSale        bool,
     is_stolen        bool,
+    split_state      bool DEFAULT false,
+    current_owner    varchar,
+    timestamp        bigint,
     start_block_num  bigint,
     end_block_num    bigint
 );
 """
 
 
+# Brings records tables created before Record.split_state up to date
+MIGRATE_RECORD_STMTS = """
+ALTER TABLE records ADD COLUMN IF NOT EXISTS split_state bool DEFAULT false;
+"""
+
+
+FETCH_RECORD_OWNER_COLUMN = """
+SELECT 1 FROM information_schema.columns
+WHERE table_name = 'records' AND column_name = 'current_owner'
+"""
+
+
+# Brings records tables created before the current_owner and creation
+# timestamp columns up to date, filling them in for the current versions
+# from their owners like the processor's _migrate_current_owner does
+MIGRATE_RECORD_OWNER_STMTS = """
+ALTER TABLE records
+ADD COLUMN IF NOT EXISTS current_owner varchar,
+ADD COLUMN IF NOT EXISTS timestamp bigint;
+
+UPDATE records SET current_owner = owners.user_id, timestamp = owners.created
+FROM (
+    SELECT DISTINCT ON (record_id) record_id, user_id,
+    min(timestamp) OVER (PARTITION BY record_id) AS created
+    FROM record_owners WHERE end_block_num = {0}
+    ORDER BY record_id, timestamp DESC, id DESC
+) owners
+WHERE records.record_id = owners.record_id
+AND records.end_block_num = {0};
+""".format(MAX_BLOCK_NUMBER)
+
+
 CREATE_RECORD_LOCATION_STMTS = """
 CREATE TABLE IF NOT EXISTS record_locations (
     id               bigserial PRIMARY KEY,
@@ -48,12 +95,20 @@ CREATE TABLE IF NOT EXISTS record_locations (
     latitude         bigint,
     longitude        bigint,
     timestamp        bigint,
+    location_index   bigint,
     start_block_num  bigint,
     end_block_num    bigint
 );
 """
 
 
+# Position of each location in the full history of its record, counting
+# evicted ones. Rows indexed before it was added have none
+MIGRATE_RECORD_LOCATION_STMTS = """
+ALTER TABLE record_locations ADD COLUMN IF NOT EXISTS location_index bigint;
+"""
+
+
 CREATE_RECORD_OWNER_STMTS = """
 CREATE TABLE IF NOT EXISTS record_owners (
     id               bigserial PRIMARY KEY,
@@ -79,6 +134,48 @@ CREATE TABLE IF NOT EXISTS users (
 """
 
 
+# Indexes of the REST API's lookups of a key at some block, and of scans
+# of the versions valid at a block
+LOOKUP_INDEXES = (
+    ('users_public_key_idx', 'users (public_key, end_block_num)'),
+    ('users_block_range_idx', 'users (end_block_num, start_block_num)'),
+    ('records_record_id_idx', 'records (record_id, end_block_num)'),
+    ('records_block_range_idx', 'records (end_block_num, start_block_num)'),
+    ('records_current_owner_idx',
+     'records (current_owner, record_id, end_block_num)'),
+    ('record_locations_record_id_idx',
+     'record_locations (record_id, end_block_num)'),
+    ('record_owners_record_id_idx',
+     'record_owners (record_id, end_block_num)'),
+)
+
+
+# Partial indexes on current versions, which is all the subscriber reads
+# and closes out
+CURRENT_INDEXES = tuple(
+    (name, definition.format(MAX_BLOCK_NUMBER)) for name, definition in (
+        ('users_current_idx',
+         'users (public_key) WHERE end_block_num = {}'),
+        ('records_current_idx',
+         'records (record_id) WHERE end_block_num = {}'),
+        ('record_locations_current_idx',
+         'record_locations (record_id, location_index)'
+         ' WHERE end_block_num = {}'),
+        ('record_owners_current_idx',
+         'record_owners (record_id) WHERE end_block_num = {}'),
+    ))
+
+
+# Channel notified whenever the blocks table changes, once per committed
+# transaction, so readers caching the latest block number refresh it
+BLOCKS_CHANNEL = 'blocks'
+
+
+# Tables holding one row per version of a resource, valid from its
+# start_block_num up to (excluding) its end_block_num
+VERSIONED_TABLES = ('users', 'records', 'record_locations', 'record_owners')
+
+
 class Database(object):
     """Simple object for managing a connection to a postgres database
     """
@@ -126,9 +223,14 @@ class Database(object):
 
             LOGGER.debug('Creating table: records')
             cursor.execute(CREATE_RECORD_STMTS)
+            cursor.execute(MIGRATE_RECORD_STMTS)
+            cursor.execute(FETCH_RECORD_OWNER_COLUMN)
+            if cursor.fetchone() is None:
+                cursor.execute(MIGRATE_RECORD_OWNER_STMTS)
 
             LOGGER.debug('Creating table: record_locations')
             cursor.execute(CREATE_RECORD_LOCATION_STMTS)
+            cursor.execute(MIGRATE_RECORD_LOCATION_STMTS)
 
             LOGGER.debug('Creating table: record_owners')
             cursor.execute(CREATE_RECORD_OWNER_STMTS)
@@ -138,6 +240,34 @@ class Database(object):
 
         self._conn.commit()
 
+    def create_indexes(self, lookup=True):
+        """Creates the indexes of the Simple Supply tables that do not
+        exist yet
+
+        Args:
+            lookup (bool): Whether to create the LOOKUP_INDEXES as well as
+                the CURRENT_INDEXES
+        """
+        indexes = CURRENT_INDEXES + (LOOKUP_INDEXES if lookup else ())
+        with self._conn.cursor() as cursor:
+            for name, definition in indexes:
+                LOGGER.debug('Creating index: %s', name)
+                cursor.execute('CREATE INDEX IF NOT EXISTS {} ON {}'.format(
+                    name, definition))
+
+        self._conn.commit()
+
+    def drop_lookup_indexes(self):
+        """Drops the LOOKUP_INDEXES, which only serve the REST API, so they
+        can be built once after ingesting many blocks
+        """
+        with self._conn.cursor() as cursor:
+            for name, _ in LOOKUP_INDEXES:
+                LOGGER.debug('Dropping index: %s', name)
+                cursor.execute('DROP INDEX IF EXISTS {}'.format(name))
+
+        self._conn.commit()
+
     def disconnect(self):
         """Closes the connection to the database
         """
@@ -152,44 +282,24 @@ class Database(object):
         self._conn.rollback()
 
     def drop_fork(self, block_num):
-        """Deletes all resources from a particular block_num
+        """Deletes all resources from a particular block_num and reopens
+        the versions they closed out
         """
-        delete_users = """
-        DELETE FROM users WHERE start_block_num >= {}
-        """.format(block_num)
-        update_users = """
-        UPDATE users SET end_block_num = null
-        WHERE end_block_num >= {}
-        """.format(block_num)
-
-        delete_record_locations = """
-        DELETE FROM record_owners WHERE record_id =
-        (SELECT record_id FROM records WHERE start_block_num >= {})
-        """.format(block_num)
-        delete_record_owners = """
-        DELETE FROM record_owners WHERE record_id =
-        (SELECT record_id FROM records WHERE start_block_num >= {})
-        """.format(block_num)
-        delete_records = """
-        DELETE FROM records WHERE start_block_num >= {}
-        """.format(block_num)
-        update_records = """
-        UPDATE records SET end_block_num = null
-        WHERE end_block_num >= {}
-        """.format(block_num)
-
-        delete_blocks = """
-        DELETE FROM blocks WHERE block_num >= {}
-        """.format(block_num)
-
         with self._conn.cursor() as cursor:
-            cursor.execute(delete_users)
-            cursor.execute(update_users)
-            cursor.execute(delete_record_locations)
-            cursor.execute(delete_record_owners)
-            cursor.execute(delete_records)
-            cursor.execute(update_records)
-            cursor.execute(delete_blocks)
+            for table in VERSIONED_TABLES:
+                cursor.execute("""
+                DELETE FROM {} WHERE start_block_num >= %s
+                """.format(table), (block_num,))
+                cursor.execute("""
+                UPDATE {} SET end_block_num = %s
+                WHERE end_block_num >= %s AND end_block_num < %s
+                """.format(table),
+                    (MAX_BLOCK_NUMBER, block_num, MAX_BLOCK_NUMBER))
+
+            cursor.execute("""
+            DELETE FROM blocks WHERE block_num >= %s
+            """, (block_num,))
+            cursor.execute('NOTIFY {}'.format(BLOCKS_CHANNEL))
 
     def fetch_last_known_blocks(self, count):
         """Fetches the specified number of most recent blocks
@@ -228,17 +338,26 @@ class Database(object):
 
         with self._conn.cursor() as cursor:
             cursor.execute(insert)
+            cursor.execute('NOTIFY {}'.format(BLOCKS_CHANNEL))
 
-    def insert_user(self, user_dict):
-        update_user = """
-        UPDATE users SET end_block_num = {}
-        WHERE end_block_num = {} AND public_key = '{}'
-        """.format(
-            user_dict['start_block_num'],
-            user_dict['end_block_num'],
-            user_dict['public_key'])
+    def insert_users(self, user_dicts):
+        """Inserts the new versions of the users changed in one block and
+        closes out their previous versions
 
-        insert_user = """
+        Args:
+            user_dicts (list of dict): Users sharing the same
+                start_block_num and end_block_num
+        """
+        if not user_dicts:
+            return
+
+        start_block_num, end_block_num = _get_block_range(user_dicts)
+        update_users = """
+        UPDATE users SET end_block_num = %s
+        WHERE end_block_num = %s AND public_key = ANY(%s)
+        """
+
+        insert_users = """
         INSERT INTO users (
         public_key,
         name,
@@ -246,114 +365,274 @@ class Database(object):
         timestamp,
         start_block_num,
         end_block_num)
-        VALUES ('{}', '{}', '{}', '{}', '{}', '{}');
-        """.format(
-            user_dict['public_key'],
-            user_dict['name'],
-            user_dict['role'],
-            user_dict['timestamp'],
-            user_dict['start_block_num'],
-            user_dict['end_block_num'])
+        VALUES %s
+        """
 
         with self._conn.cursor() as cursor:
-            cursor.execute(update_user)
-            cursor.execute(insert_user)
+            cursor.execute(update_users, (
+                start_block_num,
+                end_block_num,
+                [user['public_key'] for user in user_dicts]))
+            execute_values(cursor, insert_users, [
+                (user['public_key'],
+                 user['name'],
+                 user['role'],
+                 user['timestamp'],
+                 start_block_num,
+                 end_block_num)
+                for user in user_dicts
+            ])
+
+    def insert_records(self, record_dicts, status_dicts=()):
+        """Inserts the new versions of the records changed in one block and
+        closes out their previous versions, along with their locations and
+        owners
 
-    def insert_record(self, record_dict):
-        update_record = """
-        UPDATE records SET end_block_num = {}
-        WHERE end_block_num = {} AND record_id = '{}'
-        """.format(
-            record_dict['start_block_num'],
-            record_dict['end_block_num'],
-            record_dict['record_id'])
+        Args:
+            record_dicts (list of dict): Records sharing the same
+                start_block_num and end_block_num
+            status_dicts (list of dict): RecordStatus entries changed in
+                the same block, for records with split state
+        """
+        if not record_dicts and not status_dicts:
+            return
+
+        start_block_num, end_block_num = _get_block_range(
+            list(record_dicts) + list(status_dicts))
+        statuses = {status['record_id']: status for status in status_dicts}
+        record_ids = [record['record_id'] for record in record_dicts]
 
-        insert_record = """
+        update_records = """
+        UPDATE records SET end_block_num = %s
+        WHERE end_block_num = %s AND record_id = ANY(%s)
+        RETURNING record_id, name, price, isForSale AS "isForSale",
+        is_stolen, split_state, current_owner, timestamp
+        """
+
+        insert_records = """
         INSERT INTO records (
         record_id,
         name,
         price,
         isForSale,
         is_stolen,
+        split_state,
+        current_owner,
+        timestamp,
         start_block_num,
         end_block_num)
-        VALUES ('{}', '{}', '{}','{}', '{}', '{}', '{}');
-        """.format(
-            record_dict['record_id'],
-            record_dict['name'],
-            record_dict['price'],
-            record_dict['isForSale'],
-            record_dict['is_stolen'],
-            record_dict['start_block_num'],
-            record_dict['end_block_num'])
+        VALUES %s
+        """
 
-        with self._conn.cursor() as cursor:
-            cursor.execute(update_record)
-            cursor.execute(insert_record)
+        with self._conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(update_records, (
+                start_block_num,
+                end_block_num,
+                list(set(record_ids).union(statuses))))
+            previous = {row['record_id']: row for row in cursor.fetchall()}
+
+            rows = []
+            for record in record_dicts:
+                # The status fields of a split record are not updated on
+                # the record itself, they come from its RecordStatus
+                status = statuses.pop(record['record_id'], None)
+                if status is None and record['split_state']:
+                    status = previous.get(record['record_id'])
+                rows.append(_get_record_row(
+                    record, status or record, start_block_num, end_block_num))
+
+            # Status changes of records that did not change themselves,
+            # the first version of a record carries its own status
+            for record_id, status in statuses.items():
+                if record_id in previous:
+                    rows.append(_get_record_row(
+                        previous[record_id], status,
+                        start_block_num, end_block_num))
+
+            execute_values(cursor, insert_records, rows)
+
+        self.insert_record_locations(
+            [record for record in record_dicts if not record['split_state']])
+        self._insert_record_owners(record_dicts)
+
+    def insert_record_locations(self, locations_dicts):
+        """Indexes the locations appended to several records in one block
+        and closes out the ones evicted from state, from either Record or
+        RecordLocations entries. Locations that are already indexed are
+        left untouched
 
-        self._insert_record_locations(record_dict)
-        self._insert_record_owners(record_dict)
+        Args:
+            locations_dicts (list of dict): Entries sharing the same
+                start_block_num and end_block_num
+        """
+        if not locations_dicts:
+            return
+
+        start_block_num, end_block_num = _get_block_range(locations_dicts)
+        fetch_indexed = """
+        SELECT record_id,
+        count(*) AS count,
+        count(location_index) AS indexed,
+        min(location_index) AS first_index,
+        max(location_index) AS last_index
+        FROM record_locations
+        WHERE end_block_num = %s AND record_id = ANY(%s)
+        GROUP BY record_id
+        """
 
-    def _insert_record_locations(self, record_dict):
-        update_record_locations = """
+        replace_record_locations = """
+        UPDATE record_locations SET end_block_num = %s
+        WHERE end_block_num = %s AND record_id = ANY(%s)
+        """
+
+        evict_record_locations = """
         UPDATE record_locations SET end_block_num = {}
-        WHERE end_block_num = {} AND record_id = '{}'
-        """.format(
-            record_dict['start_block_num'],
-            record_dict['end_block_num'],
-            record_dict['record_id'])
-
-        insert_record_locations = [
-            """
-            INSERT INTO record_locations (
-            record_id,
-            latitude,
-            longitude,
-            timestamp,
-            start_block_num,
-            end_block_num)
-            VALUES ('{}', '{}', '{}', '{}', '{}', '{}');
-            """.format(
-                record_dict['record_id'],
-                location['latitude'],
-                location['longitude'],
-                location['timestamp'],
-                record_dict['start_block_num'],
-                record_dict['end_block_num'])
-            for location in record_dict['locations']
-        ]
+        FROM (VALUES %s) AS evicted (record_id, location_index)
+        WHERE record_locations.end_block_num = {}
+        AND record_locations.record_id = evicted.record_id
+        AND record_locations.location_index < evicted.location_index
+        """.format(start_block_num, end_block_num)
+
+        with self._conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(fetch_indexed, (
+                end_block_num,
+                [entry['record_id'] for entry in locations_dicts]))
+            indexed = {row['record_id']: row for row in cursor.fetchall()}
+
+            replaced = []
+            evicted = []
+            rows = []
+            for entry in locations_dicts:
+                first_index = entry['evicted_location_count']
+                previous = indexed.get(entry['record_id'])
+                if previous is None:
+                    next_index = first_index
+                elif previous['indexed'] < previous['count']:
+                    # Indexed without location_index, start over
+                    replaced.append(entry['record_id'])
+                    next_index = first_index
+                else:
+                    next_index = previous['last_index'] + 1
+                    if first_index > previous['first_index']:
+                        evicted.append((entry['record_id'], first_index))
+
+                rows.extend(
+                    (entry['record_id'],
+                     location['latitude'],
+                     location['longitude'],
+                     location['timestamp'],
+                     index,
+                     start_block_num,
+                     end_block_num)
+                    for index, location in enumerate(
+                        entry['locations'], first_index)
+                    if index >= next_index)
+
+            if replaced:
+                cursor.execute(replace_record_locations, (
+                    start_block_num, end_block_num, replaced))
+            if evicted:
+                execute_values(cursor, evict_record_locations, evicted)
+            _copy_rows(
+                cursor,
+                'record_locations',
+                ('record_id', 'latitude', 'longitude', 'timestamp',
+                 'location_index', 'start_block_num', 'end_block_num'),
+                rows)
+
+    def _insert_record_owners(self, record_dicts):
+        """Indexes the owners appended to several records in one block.
+        Owners are never removed from a record, so the ones already indexed
+        are its oldest ones
+        """
+        if not record_dicts:
+            return
+
+        start_block_num, end_block_num = _get_block_range(record_dicts)
+        fetch_indexed = """
+        SELECT record_id, count(*) FROM record_owners
+        WHERE end_block_num = %s AND record_id = ANY(%s)
+        GROUP BY record_id
+        """
+
         with self._conn.cursor() as cursor:
-            cursor.execute(update_record_locations)
-            for insert in insert_record_locations:
-                cursor.execute(insert)
-
-    def _insert_record_owners(self, record_dict):
-        update_record_owners = """
-        UPDATE record_owners SET end_block_num = {}
-        WHERE end_block_num = {} AND record_id = '{}'
-        """.format(
-            record_dict['start_block_num'],
-            record_dict['end_block_num'],
-            record_dict['record_id'])
-
-        insert_record_owners = [
-            """
-            INSERT INTO record_owners (
-            record_id,
-            user_id,
+            cursor.execute(fetch_indexed, (
+                end_block_num,
+                [record['record_id'] for record in record_dicts]))
+            indexed = dict(cursor.fetchall())
+
+            _copy_rows(
+                cursor,
+                'record_owners',
+                ('record_id', 'user_id', 'timestamp',
+                 'start_block_num', 'end_block_num'),
+                ((record['record_id'],
+                  owner['user_id'],
+                  owner['timestamp'],
+                  start_block_num,
+                  end_block_num)
+                 for record in record_dicts
+                 for owner in record['owners'][
+                     indexed.get(record['record_id'], 0):]))
+
+
+def _get_block_range(resource_dicts):
+    return (resource_dicts[0]['start_block_num'],
+            resource_dicts[0]['end_block_num'])
+
+
+def _get_record_row(record, status, start_block_num, end_block_num):
+    current_owner, timestamp = _get_record_ownership(record)
+    return (record['record_id'],
+            record['name'],
+            record['price'],
+            status['isForSale'],
+            status['is_stolen'],
+            record['split_state'],
+            current_owner,
             timestamp,
             start_block_num,
             end_block_num)
-            VALUES ('{}', '{}', '{}', '{}', '{}');
-            """.format(
-                record_dict['record_id'],
-                owner['user_id'],
-                owner['timestamp'],
-                record_dict['start_block_num'],
-                record_dict['end_block_num'])
-            for owner in record_dict['owners']
-        ]
-        with self._conn.cursor() as cursor:
-            cursor.execute(update_record_owners)
-            for insert in insert_record_owners:
-                cursor.execute(insert)
+
+
+def _get_record_ownership(record):
+    """Returns the current owner and creation timestamp of either a Record
+    entry or a row of the records table
+    """
+    owners = record.get('owners')
+    if owners is None:
+        return record['current_owner'], record['timestamp']
+    if not owners:
+        return record.get('current_owner') or None, None
+
+    # Records written before Record.current_owner have it empty
+    current_owner = record.get('current_owner') or max(
+        owners, key=lambda owner: owner['timestamp'])['user_id']
+    return current_owner, min(owner['timestamp'] for owner in owners)
+
+
+def _copy_rows(cursor, table, columns, rows):
+    """Loads rows into table with a single COPY FROM STDIN
+
+    Args:
+        cursor (psycopg2.extensions.cursor): Cursor to copy with
+        table (str): Name of the table
+        columns (tuple of str): Columns the values of each row fill
+        rows (iterable of tuple): The rows to load
+    """
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_format_copy_value(value) for value in row))
+        buffer.write('\n')
+    if not buffer.tell():
+        return
+
+    buffer.seek(0)
+    cursor.copy_expert(
+        'COPY {} ({}) FROM STDIN'.format(table, ', '.join(columns)), buffer)
+
+
+def _format_copy_value(value):
+    if value is None:
+        return '\\N'
+    return str(value).translate(COPY_ESCAPES)
@@ -1,24 +1,43 @@
 from infinity_addressing.addresser import AddressSpace
 from infinity_addressing.addresser import get_address_type
+from infinity_addressing.layout import is_single_entry
+from infinity_protobuf.user_pb2 import User
 from infinity_protobuf.user_pb2 import UserContainer
+from infinity_protobuf.record_pb2 import Record
 from infinity_protobuf.record_pb2 import RecordContainer
+from infinity_protobuf.record_pb2 import RecordLocations
+from infinity_protobuf.record_pb2 import RecordLocationsContainer
+from infinity_protobuf.record_pb2 import RecordStatus
+from infinity_protobuf.record_pb2 import RecordStatusContainer
 
 
 CONTAINERS = {
     AddressSpace.USER: UserContainer,
-    AddressSpace.RECORD: RecordContainer
+    AddressSpace.RECORD: RecordContainer,
+    AddressSpace.RECORD_STATUS: RecordStatusContainer,
+    AddressSpace.RECORD_LOCATIONS: RecordLocationsContainer
+}
+
+ENTRIES = {
+    AddressSpace.USER: User,
+    AddressSpace.RECORD: Record,
+    AddressSpace.RECORD_STATUS: RecordStatus,
+    AddressSpace.RECORD_LOCATIONS: RecordLocations
 }
 
 
-def deserialize_data(address, data):
+def deserialize_data(address, data, data_type=None):
     """Deserializes state data by type based on the address structure and
     returns it as a dictionary with the associated data type
 
     Args:
         address (str): The state address of the container
         data (str): String containing the serialized state data
+        data_type (AddressSpace, optional): The type of the address, if
+            the caller has already classified it
     """
-    data_type = get_address_type(address)
+    if data_type is None:
+        data_type = get_address_type(address)
 
     if data_type == AddressSpace.OTHER_FAMILY:
         return []
@@ -28,7 +47,10 @@ def deserialize_data(address, data):
     except KeyError:
         raise TypeError('Unknown data type: {}'.format(data_type))
 
-    entries = _parse_proto(container, data).entries
+    if is_single_entry(data):
+        entries = [_parse_proto(ENTRIES[data_type], data[1:])]
+    else:
+        entries = _parse_proto(container, data).entries
     return data_type, [_convert_proto_to_dict(pb) for pb in entries]
 
 
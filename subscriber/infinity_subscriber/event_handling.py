@@ -1,17 +1,23 @@
-import re
+import collections
 import logging
-import math
+import time
 
 import psycopg2
+from sawtooth_sdk.protobuf.events_pb2 import EventList
 from sawtooth_sdk.protobuf.transaction_receipt_pb2 import StateChangeList
 
 from infinity_addressing.addresser import AddressSpace
-from infinity_addressing.addresser import NAMESPACE
+from infinity_addressing.addresser import get_address_type
+from infinity_subscriber.database import MAX_BLOCK_NUMBER
 from infinity_subscriber.decoding import deserialize_data
 
 
-MAX_BLOCK_NUMBER = int(math.pow(2, 63)) - 1
-NAMESPACE_REGEX = re.compile('^{}'.format(NAMESPACE))
+INGESTED_TYPES = (
+    AddressSpace.USER,
+    AddressSpace.RECORD,
+    AddressSpace.RECORD_STATUS,
+    AddressSpace.RECORD_LOCATIONS
+)
 LOGGER = logging.getLogger(__name__)
 
 
@@ -22,18 +28,127 @@ def get_events_handler(database):
     return lambda events: _handle_events(database, events)
 
 
+def get_decoded_block_handler(database):
+    """Returns a handler with a reference to a specific Database object,
+    which takes the results of decode_event_list and updates the Database
+    appropriately
+    """
+    return lambda decoded_block: _handle_decoded_block(
+        database, decoded_block)
+
+
+def get_catch_up_handler(database, chain_head_num, commit_interval):
+    """Returns a handler of decode_event_list results, with a reference to
+    a specific Database object, for replaying the chain from the last
+    known block. Up to chain_head_num it commits every commit_interval
+    blocks and reports progress. Then it creates the indexes deferred by
+    Database.drop_lookup_indexes and commits every block, like the
+    handler of get_decoded_block_handler.
+    """
+    return _CatchUpHandler(database, chain_head_num, commit_interval)
+
+
+def decode_event_list(content):
+    """Decodes a serialized EventList into the block it commits and the
+    state changes of that block, without touching the database. Run by the
+    decoding workers of a PipelinedSubscriber
+
+    Args:
+        content (bytes): The serialized EventList
+
+    Returns:
+        tuple: The block_num, block_id and a dict of the decoded resources
+            by AddressSpace
+    """
+    event_list = EventList()
+    event_list.ParseFromString(content)
+    return _decode_block(event_list.events)
+
+
 def _handle_events(database, events):
-    block_num, block_id = _parse_new_block(events)
+    _handle_decoded_block(database, _decode_block(events))
+
+
+def _handle_decoded_block(database, decoded_block):
+    block_num, block_id, resources = decoded_block
     try:
         is_duplicate = _resolve_if_forked(database, block_num, block_id)
         if not is_duplicate:
-            _apply_state_changes(database, events, block_num, block_id)
+            _apply_state_changes(database, block_num, block_id, resources)
         database.commit()
     except psycopg2.DatabaseError as err:
         LOGGER.exception('Unable to handle event: %s', err)
         database.rollback()
 
 
+class _CatchUpHandler(object):
+    def __init__(self, database, chain_head_num, commit_interval):
+        self._database = database
+        self._chain_head_num = chain_head_num
+        self._commit_interval = commit_interval
+        self._is_caught_up = False
+        self._uncommitted = 0
+        self._handled = 0
+        self._start_time = time.perf_counter()
+
+    def __call__(self, decoded_block):
+        if self._is_caught_up:
+            _handle_decoded_block(self._database, decoded_block)
+            return
+
+        block_num, block_id, resources = decoded_block
+        try:
+            is_duplicate = _resolve_if_forked(
+                self._database, block_num, block_id)
+            if not is_duplicate:
+                _apply_state_changes(
+                    self._database, block_num, block_id, resources)
+        except psycopg2.DatabaseError:
+            # Blocks since the last commit are lost, stop so catching up
+            # resumes from there
+            self._database.rollback()
+            raise
+
+        self._uncommitted += 1
+        self._handled += 1
+        if block_num >= self._chain_head_num:
+            self._commit(block_num)
+            self._go_live()
+        elif self._uncommitted >= self._commit_interval:
+            self._commit(block_num)
+
+    def _commit(self, block_num):
+        self._database.commit()
+        self._uncommitted = 0
+        LOGGER.info(
+            'Caught up to block %s of %s (%.1f blocks/sec)',
+            block_num,
+            self._chain_head_num,
+            self._handled / (time.perf_counter() - self._start_time))
+
+    def _go_live(self):
+        LOGGER.info('Creating deferred indexes')
+        self._database.create_indexes()
+        self._is_caught_up = True
+        LOGGER.info('Caught up with the chain head, handling new blocks')
+
+
+def _decode_block(events):
+    block_num, block_id = _parse_new_block(events)
+    resources = collections.defaultdict(list)
+    for change, data_type in _parse_state_changes(events):
+        data_type, entries = deserialize_data(
+            change.address, change.value, data_type)
+        if data_type not in INGESTED_TYPES:
+            LOGGER.warning('Unsupported data type: %s', data_type)
+            continue
+        for entry in entries:
+            entry['start_block_num'] = block_num
+            entry['end_block_num'] = MAX_BLOCK_NUMBER
+        resources[data_type].extend(entries)
+    return block_num, block_id, resources
+
+
 def _parse_new_block(events):
     try:
         block_attr = next(e.attributes for e in events
@@ -62,17 +177,14 @@ def _resolve_if_forked(database, block_num, block_id):
     return False
 
 
-def _apply_state_changes(database, events, block_num, block_id):
-    changes = _parse_state_changes(events)
-    for change in changes:
-        data_type, resources = deserialize_data(change.address, change.value)
-        database.insert_block({'block_num': block_num, 'block_id': block_id})
-        if data_type == AddressSpace.USER:
-            _apply_user_change(database, block_num, resources)
-        elif data_type == AddressSpace.RECORD:
-            _apply_record_change(database, block_num, resources)
-        else:
-            LOGGER.warning('Unsupported data type: %s', data_type)
+def _apply_state_changes(database, block_num, block_id, resources):
+    database.insert_block({'block_num': block_num, 'block_id': block_id})
+    database.insert_users(resources[AddressSpace.USER])
+    database.insert_records(
+        resources[AddressSpace.RECORD],
+        resources[AddressSpace.RECORD_STATUS])
+    database.insert_record_locations(
+        resources[AddressSpace.RECORD_LOCATIONS])
 
 
 def _parse_state_changes(events):
@@ -84,19 +196,9 @@ def _parse_state_changes(events):
 
     state_change_list = StateChangeList()
     state_change_list.ParseFromString(change_data)
-    return [c for c in state_change_list.state_changes
-            if NAMESPACE_REGEX.match(c.address)]
-
-
-def _apply_user_change(database, block_num, users):
-    for user in users:
-        user['start_block_num'] = block_num
-        user['end_block_num'] = MAX_BLOCK_NUMBER
-        database.insert_user(user)
-
-
-def _apply_record_change(database, block_num, records):
-    for record in records:
-        record['start_block_num'] = block_num
-        record['end_block_num'] = MAX_BLOCK_NUMBER
-        database.insert_record(record)
+    changes = []
+    for change in state_change_list.state_changes:
+        data_type = get_address_type(change.address)
+        if data_type != AddressSpace.OTHER_FAMILY:
+            changes.append((change, data_type))
+    return changes
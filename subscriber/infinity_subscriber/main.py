@@ -1,10 +1,15 @@
 
 import argparse
+import os
 import sys
 import logging
 
 from infinity_subscriber.database import Database
+from infinity_subscriber.subscriber import PipelinedSubscriber
 from infinity_subscriber.subscriber import Subscriber
+from infinity_subscriber.event_handling import decode_event_list
+from infinity_subscriber.event_handling import get_catch_up_handler
+from infinity_subscriber.event_handling import get_decoded_block_handler
 from infinity_subscriber.event_handling import get_events_handler
 
 
@@ -49,13 +54,44 @@ def parse_args(args):
         'init',
         parents=[database_parser])
 
-    subscribe_parser = subparsers.add_parser(
-        'subscribe',
-        parents=[database_parser])
-    subscribe_parser.add_argument(
+    validator_parser = argparse.ArgumentParser(add_help=False)
+    validator_parser.add_argument(
         '-C', '--connect',
         help='The url of the validator to subscribe to',
         default='tcp://localhost:4004')
+    validator_parser.add_argument(
+        '--queue-size',
+        help='Number of blocks received and decoded ahead of the database '
+             'writes when decoding in worker processes',
+        type=int,
+        default=64)
+
+    subscribe_parser = subparsers.add_parser(
+        'subscribe',
+        parents=[database_parser, validator_parser])
+    subscribe_parser.add_argument(
+        '--decode-workers',
+        help='Number of processes decoding events ahead of the database '
+             'writes, 0 to decode and write each block in turn',
+        type=int,
+        default=0)
+
+    catchup_parser = subparsers.add_parser(
+        'catchup',
+        parents=[database_parser, validator_parser])
+    catchup_parser.add_argument(
+        '--decode-workers',
+        help='Number of processes decoding events ahead of the database '
+             'writes',
+        type=int,
+        default=os.cpu_count() or 1)
+    catchup_parser.add_argument(
+        '--commit-interval',
+        help='Number of blocks written per commit until caught up. The '
+             'indexes only used by the REST API are also dropped until '
+             'then if the database is further behind than this',
+        type=int,
+        default=1000)
 
     return parser.parse_args(args)
 
@@ -83,10 +119,71 @@ def do_subscribe(opts):
 
         database = Database(dsn)
         database.connect()
-        subscriber = Subscriber(opts.connect)
-        subscriber.add_handler(get_events_handler(database))
+        # Restores the lookup indexes if a catch up stopped before
+        # rebuilding them
+        database.create_indexes()
+        if opts.decode_workers > 0:
+            subscriber = PipelinedSubscriber(
+                opts.connect,
+                decode_event_list,
+                opts.decode_workers,
+                opts.queue_size)
+            subscriber.add_handler(get_decoded_block_handler(database))
+        else:
+            subscriber = Subscriber(opts.connect)
+            subscriber.add_handler(get_events_handler(database))
+        known_blocks = database.fetch_last_known_blocks(KNOWN_COUNT)
+        known_ids = [block['block_id'] for block in known_blocks]
+        subscriber.start(known_ids=known_ids)
+
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+    except Exception as err:  # pylint: disable=broad-except
+        LOGGER.exception(err)
+        sys.exit(1)
+
+    finally:
+        try:
+            database.disconnect()
+            subscriber.stop()
+        except UnboundLocalError:
+            pass
+
+    LOGGER.info('Subscriber shut down successfully')
+
+
+def do_catchup(opts):
+    LOGGER.info('Starting subscriber catch up...')
+    try:
+        dsn = 'dbname={} user={} password={} host={} port={}'.format(
+            opts.db_name,
+            opts.db_user,
+            opts.db_password,
+            opts.db_host,
+            opts.db_port)
+
+        database = Database(dsn)
+        database.connect()
+        database.create_tables()
+        database.create_indexes(lookup=False)
+
+        subscriber = PipelinedSubscriber(
+            opts.connect,
+            decode_event_list,
+            max(opts.decode_workers, 1),
+            opts.queue_size)
+        chain_head_num = subscriber.fetch_chain_head_num()
         known_blocks = database.fetch_last_known_blocks(KNOWN_COUNT)
         known_ids = [block['block_id'] for block in known_blocks]
+        last_block_num = known_blocks[0]['block_num'] if known_blocks else -1
+        LOGGER.info(
+            'Catching up from block %s to %s', last_block_num, chain_head_num)
+
+        if chain_head_num - last_block_num > opts.commit_interval:
+            database.drop_lookup_indexes()
+        subscriber.add_handler(get_catch_up_handler(
+            database, chain_head_num, opts.commit_interval))
         subscriber.start(known_ids=known_ids)
 
     except KeyboardInterrupt:
@@ -118,6 +215,7 @@ def do_init(opts):
         database = Database(dsn)
         database.connect()
         database.create_tables()
+        database.create_indexes()
 
     except Exception as err:  # pylint: disable=broad-except
         LOGGER.exception('Unable to initialize subscriber database: %s', err)
@@ -132,6 +230,8 @@ def main():
 
     if opts.command == 'subscribe':
         do_subscribe(opts)
+    elif opts.command == 'catchup':
+        do_catchup(opts)
     elif opts.command == 'init':
         do_init(opts)
     else:
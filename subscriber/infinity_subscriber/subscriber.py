@@ -1,5 +1,11 @@
+from concurrent import futures
 import logging
+import queue
+import threading
 
+from sawtooth_sdk.protobuf.block_pb2 import BlockHeader
+from sawtooth_sdk.protobuf.client_block_pb2 import ClientBlockListRequest
+from sawtooth_sdk.protobuf.client_block_pb2 import ClientBlockListResponse
 from sawtooth_sdk.protobuf.client_event_pb2 import ClientEventsSubscribeRequest
 from sawtooth_sdk.protobuf.client_event_pb2\
     import ClientEventsSubscribeResponse
@@ -10,6 +16,8 @@ from sawtooth_sdk.protobuf.client_event_pb2\
 from sawtooth_sdk.protobuf.events_pb2 import EventList
 from sawtooth_sdk.protobuf.events_pb2 import EventSubscription
 from sawtooth_sdk.protobuf.events_pb2 import EventFilter
+from sawtooth_sdk.protobuf.client_list_control_pb2\
+    import ClientPagingControls
 from sawtooth_sdk.protobuf.validator_pb2 import Message
 from sawtooth_sdk.messaging.stream import Stream
 
@@ -18,6 +26,7 @@ from infinity_addressing.addresser import NAMESPACE
 
 LOGGER = logging.getLogger(__name__)
 NULL_BLOCK_ID = '0000000000000000'
+QUEUE_POLL_INTERVAL = 1
 
 
 class Subscriber(object):
@@ -42,6 +51,27 @@ class Subscriber(object):
         """
         self._event_handlers = []
 
+    def fetch_chain_head_num(self):
+        """Returns the block number of the validator's chain head
+        """
+        self._stream.wait_for_ready()
+        request = ClientBlockListRequest(
+            paging=ClientPagingControls(limit=1))
+        response_future = self._stream.send(
+            Message.CLIENT_BLOCK_LIST_REQUEST,
+            request.SerializeToString())
+        response = ClientBlockListResponse()
+        response.ParseFromString(response_future.result().content)
+
+        if response.status != ClientBlockListResponse.OK:
+            raise RuntimeError(
+                'Fetching the chain head failed with status: {}'.format(
+                    ClientBlockListResponse.Status.Name(response.status)))
+
+        header = BlockHeader()
+        header.ParseFromString(response.blocks[0].header)
+        return header.block_num
+
     def start(self, known_ids=None):
         """Subscribes to state delta events, and then waits to receive deltas.
         Sends any events received to delta handlers.
@@ -83,6 +113,9 @@ class Subscriber(object):
         self._is_active = True
 
         LOGGER.debug('Successfully subscribed to state delta events')
+        self._receive_events()
+
+    def _receive_events(self):
         while self._is_active:
             message_future = self._stream.receive()
 
@@ -111,3 +144,70 @@ class Subscriber(object):
                 ClientEventsUnsubscribeResponse.Status.Name(response.status))
 
         self._stream.close()
+
+
+class PipelinedSubscriber(Subscriber):
+    """Subscriber that decodes the event lists it receives in a pool of
+    worker processes, so receiving and decoding run ahead of the handlers.
+    Handlers are passed the decoded event lists one at a time, from a
+    single writer thread, in the order they were received. At most
+    queue_size event lists are held ahead of the handlers, after which
+    receiving waits for them to catch up.
+    """
+    def __init__(self, validator_url, decoder, workers, queue_size):
+        """
+        Args:
+            validator_url (str): The url of the validator to subscribe to
+            decoder (function): Takes a serialized EventList and returns
+                what is passed to the handlers. Must be picklable
+            workers (int): Number of decoding processes
+            queue_size (int): Number of event lists received ahead of the
+                handlers
+        """
+        super().__init__(validator_url)
+        self._decoder = decoder
+        self._workers = workers
+        self._queue_size = queue_size
+        self._writer_error = None
+
+    def _receive_events(self):
+        pending = queue.Queue(self._queue_size)
+        with futures.ProcessPoolExecutor(self._workers) as pool:
+            writer = threading.Thread(
+                target=self._write_events, args=(pending,), daemon=True)
+            writer.start()
+            try:
+                while self._is_active and writer.is_alive():
+                    message_future = self._stream.receive()
+                    content = message_future.result().content
+                    self._put(
+                        pending, pool.submit(self._decoder, content), writer)
+            finally:
+                # Let the writer drain what was already received
+                self._put(pending, None, writer)
+                writer.join()
+
+        if self._writer_error is not None:
+            raise self._writer_error
+
+    def _write_events(self, pending):
+        try:
+            while True:
+                decoded_future = pending.get()
+                if decoded_future is None:
+                    return
+                decoded = decoded_future.result()
+                for handler in self._event_handlers:
+                    handler(decoded)
+        except Exception as err:  # pylint: disable=broad-except
+            self._writer_error = err
+
+    @staticmethod
+    def _put(pending, item, writer):
+        """Waits for room in pending for as long as the writer runs"""
+        while writer.is_alive():
+            try:
+                pending.put(item, timeout=QUEUE_POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue